@@ -5,9 +5,28 @@
 # Sukbong Kwon (Galois)
 
 
-from .create import create_app, create_settings
+from .create import create_app, create_settings, apply_settings
+from .jobs import JobStore, Job, create_job_store, set_job_store, get_job_store
 from .routes.upload import upload_file, upload_file_to_uri
-from .routes.batch import run_batch, run_batch_uri, run_batch_uris
-from .routes.status import Status, check_status, set_status_path
+from .routes.batch import (
+    run_batch,
+    schedule_batch,
+    schedule_batch_uri,
+    run_batch_uri,
+    run_batch_uris,
+    iter_batch_uris,
+    finish_batch_uris,
+    batch_item_path,
+)
+from .scheduler import (
+    Scheduler,
+    PRIORITIES,
+    CLIENT_HEADER,
+    configure_scheduler,
+    get_scheduler,
+    queue_position,
+    pop_scheduling,
+)
+from .routes.status import Status, check_status, set_status_path, update_status
 from .routes.result import get_result
-from .routes.request import request_upload, request_result, request_run, request_uri
\ No newline at end of file
+from .routes.request import request_upload, request_result, request_run, request_uri, request_uri_async, request_uris, request_jobs
\ No newline at end of file
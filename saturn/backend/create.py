@@ -11,6 +11,10 @@ from typing import Text
 from fastapi import FastAPI
 from dataclasses import dataclass
 
+from saturn.utils.save import set_fsync_policy
+from .jobs import create_job_store, set_job_store
+from .scheduler import configure_scheduler
+
 
 def create_app(
     app_name: Text,
@@ -25,11 +29,23 @@ class Setting:
     updated_at: Text
     exp_folder: Path
     workers: int = 2
+    max_queue: int = 32
+    executor: Text = "thread"
+    client_max_running: int = 0
+    client_max_queue: int = 0
+    job_store: Text = "file"
+    fsync: Text = "file"
 
 def create_settings(
     version: Text,
     exp_folder: Text = "exp",
     workers: int = 2,
+    max_queue: int = 32,
+    executor: Text = "thread",
+    client_max_running: int = 0,
+    client_max_queue: int = 0,
+    job_store: Text = "file",
+    fsync: Text = "file",
 )-> Setting:
     """Create setting object for the application.
 
@@ -39,6 +55,22 @@ def create_settings(
         Path to the version file.
     workers : int, optional
         Number of workers for the application, by default 2
+    max_queue : int, optional
+        Number of jobs waiting for a worker before requests are rejected
+        with `ERROR_SERVER_IS_BUSY`, by default 32
+    executor : Text, optional
+        `thread` or `process` workers, by default `thread`
+    client_max_running : int, optional
+        Jobs of one client (`X-Client-Id`) running at once, by default 0 (no limit)
+    client_max_queue : int, optional
+        Jobs of one client waiting for a worker, by default 0 (no limit)
+    job_store : Text, optional
+        Backend of the job states, `file`, `memory` or `sqlite`, by default `file`
+    fsync : Text, optional
+        Durability of the status and result files, `none`, `file` or `full`,
+        by default `file`
+
+    The setting is applied with `apply_settings` before it is returned.
 
     Returns
     -------
@@ -48,7 +80,7 @@ def create_settings(
     Examples
     --------
     >>> create_setting("VERSION")
-    Setting(app_name='N/A', version='N/A', updated_at='N/A', exp_folder=PosixPath('exp'), workers=2)
+    Setting(app_name='N/A', version='N/A', updated_at='N/A', exp_folder=PosixPath('exp'), workers=2, max_queue=32, executor='thread', client_max_running=0, client_max_queue=0, job_store='file', fsync='file')
 
     `VERSION` file should be in the following format:
     ```
@@ -63,10 +95,37 @@ def create_settings(
         version = "N/A"
         updated_at = "N/A"
 
-    return Setting(
+    setting = Setting(
         app_name=app_name,
         version=version,
         updated_at=updated_at,
         exp_folder=Path(exp_folder),
         workers=workers,
-    )
\ No newline at end of file
+        max_queue=max_queue,
+        executor=executor,
+        client_max_running=client_max_running,
+        client_max_queue=client_max_queue,
+        job_store=job_store,
+        fsync=fsync,
+    )
+    apply_settings(setting)
+    return setting
+
+
+def apply_settings(
+    setting: Setting,
+)-> None:
+    """Configure the schedulers, the job store and the fsync policy
+
+    Schedulers created before keep their options, apply the setting before
+    the first job is submitted.
+    """
+    set_fsync_policy(setting.fsync)
+    set_job_store(create_job_store(setting.job_store, setting.exp_folder))
+    configure_scheduler(
+        workers=setting.workers,
+        max_queue=setting.max_queue,
+        mode=setting.executor,
+        client_max_running=setting.client_max_running,
+        client_max_queue=setting.client_max_queue,
+    )
@@ -0,0 +1,403 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Copyright (c) 2024- SATURN
+# AUTHORS:
+# Sukbong Kwon (Galois)
+
+# State of the jobs (status, timestamps and result) behind the routes
+#
+# A job is known by its status path `exp/{id}/{id}.status`, the handle the
+# routes pass around, and its ID is the stem of that path. Backends:
+#   file    the `{id}.status` text file of each job (default)
+#   memory  dictionaries of the process
+#   sqlite  an embedded SQLite database in WAL mode, shared by processes
+
+import os
+import time
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from pathlib import Path
+from dataclasses import dataclass, field, asdict, replace
+from typing import Dict, List, Optional, Set, Text, Tuple, Union
+
+from saturn.utils.save import atomic_write
+
+# Value of `Status.DONE`, the detail of a done job is its result
+DONE = "DONE"
+
+
+@dataclass
+class Job:
+    id: Text
+    status: Text
+    detail: Text = ""
+    path: Text = ""
+    result: Optional[Text] = None
+    # None if the backend doesn't know it (file)
+    created_at: Optional[float] = None
+    updated_at: float = 0.0
+    # (status, detail, time) of every change, if the backend keeps them
+    transitions: List[Tuple[Text, Text, float]] = field(default_factory=list)
+
+    def to_dict(
+        self,
+    )-> Dict:
+        return asdict(self)
+
+
+def job_id(
+    status_path: Union[Text, Path],
+)-> Text:
+    return Path(status_path).stem
+
+
+class JobStore(ABC):
+    """Interface of the job stores"""
+
+    @abstractmethod
+    def create(
+        self,
+        status_path: Path,
+        status: Text,
+        detail: Text = "",
+    )-> Job:
+        """Start a job (again, if the ID was used before)"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def update(
+        self,
+        status_path: Path,
+        status: Text,
+        detail: Text = "",
+    )-> None:
+        """Record a change of the status of a job"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def get(
+        self,
+        status_path: Path,
+    )-> Optional[Job]:
+        """Job of the status path, None if it is unknown"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def jobs(
+        self,
+        status: Optional[Text] = None,
+        limit: Optional[int] = None,
+    )-> List[Job]:
+        """Jobs, optionally of one status, most recently updated first"""
+        raise NotImplementedError
+
+
+class FileJobStore(JobStore):
+    def __init__(
+        self,
+        root: Optional[Union[Text, Path]] = None,
+    )-> None:
+        """Jobs as `status<TAB>detail` text files, next to their inputs
+
+        This is the original layout. The update time comes from the file,
+        the creation time is unknown (every update replaces the file) and
+        transitions are not kept. Listing the jobs scans `root` and the
+        experiment folders of the jobs created since. Files are replaced
+        atomically, a reader never sees a truncated status.
+        """
+        self.roots: Set[Path] = {Path(root)} if root is not None else set()
+
+    def create(
+        self,
+        status_path: Path,
+        status: Text,
+        detail: Text = "",
+    )-> Job:
+        # `exp/{id}/{id}.status`, remember `exp` for `jobs`
+        self.roots.add(Path(status_path).parent.parent)
+        self.update(status_path, status, detail)
+        return self.get(status_path)
+
+    def update(
+        self,
+        status_path: Path,
+        status: Text,
+        detail: Text = "",
+    )-> None:
+        atomic_write(status_path, f"{status}\t{detail}")
+
+    def get(
+        self,
+        status_path: Path,
+    )-> Optional[Job]:
+        status_path = Path(status_path)
+        try:
+            text = status_path.read_text(encoding="utf-8")
+            stat = status_path.stat()
+        except FileNotFoundError:
+            return None
+
+        status, _, detail = text.partition("\t")
+        return Job(
+            id=job_id(status_path),
+            status=status,
+            detail=detail,
+            path=str(status_path),
+            result=detail if status == DONE else None,
+            updated_at=stat.st_mtime,
+        )
+
+    def jobs(
+        self,
+        status: Optional[Text] = None,
+        limit: Optional[int] = None,
+    )-> List[Job]:
+        paths = {path for root in list(self.roots) for path in root.glob("*/*.status")}
+        jobs = [self.get(path) for path in paths]
+        jobs = [job for job in jobs if job and (status is None or job.status == status)]
+        jobs.sort(key=lambda job: job.updated_at, reverse=True)
+        return jobs[:limit]
+
+
+class MemoryJobStore(JobStore):
+    def __init__(
+        self,
+    )-> None:
+        """Jobs in dictionaries of this process, indexed by status"""
+        self._jobs: Dict[Text, Job] = {}
+        self._by_status: Dict[Text, Dict[Text, None]] = {}
+        self._lock = threading.Lock()
+
+    def create(
+        self,
+        status_path: Path,
+        status: Text,
+        detail: Text = "",
+    )-> Job:
+        now = time.time()
+        job = Job(
+            id=job_id(status_path),
+            status=status,
+            detail=detail,
+            path=str(status_path),
+            created_at=now,
+            updated_at=now,
+            transitions=[(status, detail, now)],
+        )
+        with self._lock:
+            old = self._jobs.get(job.id)
+            if old is not None:
+                self._by_status[old.status].pop(job.id, None)
+            self._jobs[job.id] = job
+            self._by_status.setdefault(status, {})[job.id] = None
+        return job
+
+    def update(
+        self,
+        status_path: Path,
+        status: Text,
+        detail: Text = "",
+    )-> None:
+        id = job_id(status_path)
+        with self._lock:
+            job = self._jobs.get(id)
+            if job is None:
+                job = self._jobs[id] = Job(id=id, status=status, path=str(status_path))
+                job.created_at = time.time()
+            self._by_status.get(job.status, {}).pop(id, None)
+
+            job.updated_at = time.time()
+            job.status = status
+            job.detail = detail
+            if status == DONE:
+                job.result = detail
+            job.transitions.append((status, detail, job.updated_at))
+            self._by_status.setdefault(status, {})[id] = None
+
+    def get(
+        self,
+        status_path: Path,
+    )-> Optional[Job]:
+        """Copy of the job, taken under the lock so it is never half updated"""
+        with self._lock:
+            job = self._jobs.get(job_id(status_path))
+            return None if job is None else replace(job, transitions=list(job.transitions))
+
+    def jobs(
+        self,
+        status: Optional[Text] = None,
+        limit: Optional[int] = None,
+    )-> List[Job]:
+        with self._lock:
+            if status is None:
+                jobs = list(self._jobs.values())
+            else:
+                jobs = [self._jobs[id] for id in self._by_status.get(status, {})]
+            jobs = [replace(job, transitions=list(job.transitions)) for job in jobs]
+        jobs.sort(key=lambda job: job.updated_at, reverse=True)
+        return jobs[:limit]
+
+
+class SQLiteJobStore(JobStore):
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS jobs (
+        id TEXT PRIMARY KEY,
+        status TEXT NOT NULL,
+        detail TEXT,
+        path TEXT,
+        result TEXT,
+        created_at REAL,
+        updated_at REAL
+    );
+    CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, updated_at);
+    CREATE INDEX IF NOT EXISTS jobs_updated ON jobs (updated_at);
+    CREATE TABLE IF NOT EXISTS transitions (
+        id TEXT NOT NULL,
+        status TEXT NOT NULL,
+        detail TEXT,
+        at REAL
+    );
+    CREATE INDEX IF NOT EXISTS transitions_id ON transitions (id);
+    """
+    COLUMNS = "id, status, detail, path, result, created_at, updated_at"
+
+    def __init__(
+        self,
+        path: Union[Text, Path],
+        timeout: float = 10.0,
+    )-> None:
+        """Jobs in an SQLite database in WAL mode
+
+        Readers don't block the writer, so polling doesn't slow the jobs
+        down, and several processes can share the database. Each thread
+        (and forked process) opens its own connection.
+
+        Parameters
+        ----------
+        path : Union[Text, Path]
+            Database file
+        timeout : float
+            Seconds to wait for a lock held by another connection
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.timeout = timeout
+        self._local = threading.local()
+        with self.connection() as db:
+            db.executescript(self.SCHEMA)
+
+    def connection(
+        self,
+    )-> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None or self._local.pid != os.getpid():
+            db = sqlite3.connect(self.path, timeout=self.timeout)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db, self._local.pid = db, os.getpid()
+        return db
+
+    def create(
+        self,
+        status_path: Path,
+        status: Text,
+        detail: Text = "",
+    )-> Job:
+        id, now = job_id(status_path), time.time()
+        with self.connection() as db:
+            db.execute("DELETE FROM transitions WHERE id = ?", (id,))
+            db.execute(
+                f"INSERT OR REPLACE INTO jobs ({self.COLUMNS}) VALUES (?, ?, ?, ?, NULL, ?, ?)",
+                (id, status, detail, str(status_path), now, now),
+            )
+            db.execute("INSERT INTO transitions VALUES (?, ?, ?, ?)", (id, status, detail, now))
+        return Job(id, status, detail, str(status_path), None, now, now, [(status, detail, now)])
+
+    def update(
+        self,
+        status_path: Path,
+        status: Text,
+        detail: Text = "",
+    )-> None:
+        id, now = job_id(status_path), time.time()
+        result = detail if status == DONE else None
+        with self.connection() as db:
+            updated = db.execute(
+                "UPDATE jobs SET status = ?, detail = ?, result = COALESCE(?, result), "
+                "updated_at = ? WHERE id = ?",
+                (status, detail, result, now, id),
+            ).rowcount
+            if not updated:
+                db.execute(
+                    f"INSERT INTO jobs ({self.COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (id, status, detail, str(status_path), result, now, now),
+                )
+            db.execute("INSERT INTO transitions VALUES (?, ?, ?, ?)", (id, status, detail, now))
+
+    def get(
+        self,
+        status_path: Path,
+    )-> Optional[Job]:
+        id = job_id(status_path)
+        db = self.connection()
+        row = db.execute(f"SELECT {self.COLUMNS} FROM jobs WHERE id = ?", (id,)).fetchone()
+        if row is None:
+            return None
+        transitions = db.execute(
+            "SELECT status, detail, at FROM transitions WHERE id = ? ORDER BY rowid", (id,)
+        ).fetchall()
+        return Job(*row, transitions=transitions)
+
+    def jobs(
+        self,
+        status: Optional[Text] = None,
+        limit: Optional[int] = None,
+    )-> List[Job]:
+        query = f"SELECT {self.COLUMNS} FROM jobs"
+        params: Tuple = ()
+        if status is not None:
+            query += " WHERE status = ?"
+            params = (status,)
+        query += " ORDER BY updated_at DESC LIMIT ?"
+        params += (-1 if limit is None else limit,)
+        return [Job(*row) for row in self.connection().execute(query, params)]
+
+
+JOB_STORES = {
+    "file": FileJobStore,
+    "memory": MemoryJobStore,
+    "sqlite": SQLiteJobStore,
+}
+
+# Until `set_job_store`, the status files of the experiment folders in use
+job_store: JobStore = FileJobStore()
+
+
+def create_job_store(
+    backend: Text = "file",
+    exp_folder: Union[Text, Path] = "exp",
+)-> JobStore:
+    """Job store of `backend` for the experiment folder
+
+    The SQLite database is `exp_folder/jobs.db`.
+    """
+    if backend not in JOB_STORES:
+        raise ValueError(f"Unknown job store '{backend}', choose from {list(JOB_STORES)}")
+    if backend == "file":
+        return FileJobStore(exp_folder)
+    if backend == "sqlite":
+        return SQLiteJobStore(Path(exp_folder) / "jobs.db")
+    return MemoryJobStore()
+
+
+def set_job_store(
+    store: JobStore,
+)-> None:
+    """Use `store` for the jobs of every route"""
+    global job_store
+    job_store = store
+
+
+def get_job_store()-> JobStore:
+    return job_store
@@ -7,13 +7,20 @@
 # Batch processing in the background
 
 import json
+import time
+import queue
 import asyncio
 from pathlib import Path
-from typing import Dict, Any, Text, Callable, List
-from .status import Status, check_status
+from collections import deque
+from concurrent.futures import Future, FIRST_COMPLETED, wait
+from typing import Dict, Any, Text, Callable, Iterator, List, Tuple, Union
+from .status import Status, check_status, update_status
+from saturn.utils.save import atomic_write
+from ..scheduler import get_scheduler
 from saturn.utils.status_code import (
     MESSAGE_SUCCESS,
     ERROR_PROCESS_FAILED,
+    ERROR_SERVER_IS_BUSY,
 )
 
 
@@ -26,6 +33,141 @@ def inference(
     return callback(file_path, out_dir, **kwargs)
 
 
+def save_batch_result(
+    status_path: Path,
+    job: Future,
+)-> Text:
+    """Save the result of a finished job and set its status
+
+    Returns
+    -------
+    Text
+        The path to the result file, empty if the job failed.
+    """
+    try:
+        # Save the result and set the status to "done"
+        result = job.result()
+        result_path = status_path.with_suffix(".json")
+        atomic_write(result_path, json.dumps(result, indent=4, ensure_ascii=False))
+        update_status(status_path, Status.DONE, str(result_path))
+        return str(result_path)
+    except Exception as e:
+        # Set the status to "failed"
+        update_status(status_path, Status.FAILED, str(e))
+        return ""
+
+
+def schedule_batch(
+    callback: Callable[..., Any],
+    status_path: Path,
+    file_path: Path,
+    out_dir: Path,
+    client: Text = "",
+    priority: Union[Text, int] = "normal",
+    **kwargs: Dict[Text, Any],
+)-> Future:
+    """Queue a batch processing on the scheduler of `callback`.
+
+    The job is PENDING or WAITING until a worker takes it, see
+    `saturn.backend.scheduler`. Jobs of a higher `priority` go first and
+    clients take turns within a priority.
+
+    Returns
+    -------
+    Future
+        The path to the result file, empty if the job failed.
+
+    Raises
+    ------
+    queue.Full
+        If the scheduler or the queue of the client is full,
+        the status is left untouched.
+    ValueError
+        If the priority is unknown.
+    """
+    job = get_scheduler(callback).submit(
+        inference,
+        file_path,
+        out_dir,
+        dict(kwargs),
+        status_path=status_path,
+        detail=str(file_path),
+        client=client,
+        priority=priority,
+    )
+    saved: Future = Future()
+    job.add_done_callback(lambda job: saved.set_result(save_batch_result(status_path, job)))
+    return saved
+
+
+def batch_uri_response(
+    id: Text,
+    status_path: Path,
+    uri: Text,
+    job: Future,
+)-> Dict:
+    """Set the status of a finished URI job and build its response"""
+    try:
+        result = job.result()
+        update_status(status_path, Status.DONE, uri)
+        return MESSAGE_SUCCESS(
+            content={
+                "id": id,
+                "result": result,
+            }
+        ).__dict__
+    except Exception as e:
+        update_status(status_path, Status.FAILED, uri)
+        return ERROR_PROCESS_FAILED(
+            content={
+                "id": id,
+                'error': str(e),
+            }
+        ).__dict__
+
+
+def schedule_batch_uri(
+    callback: Callable[..., Any],
+    uri: Text,
+    id: Text,
+    status_path: Path,
+    out_dir: Path,
+    client: Text = "",
+    priority: Union[Text, int] = "normal",
+    **kwargs: Dict[Text, Any],
+)-> Future:
+    """Queue a batch processing with a URI on the scheduler of `callback`.
+
+    Same as `run_batch_uri`, but the job shares the workers, priorities
+    and client caps of the uploaded files.
+
+    Returns
+    -------
+    Future
+        The response of `run_batch_uri`.
+
+    Raises
+    ------
+    queue.Full
+        If the scheduler or the queue of the client is full.
+    ValueError
+        If the priority is unknown.
+    """
+    job = get_scheduler(callback).submit(
+        inference,
+        uri,
+        out_dir,
+        dict(kwargs),
+        status_path=status_path,
+        detail=uri,
+        client=client,
+        priority=priority,
+    )
+    response: Future = Future()
+    job.add_done_callback(lambda job: response.set_result(batch_uri_response(id, status_path, uri, job)))
+    return response
+
+
 async def run_batch(
     callback: Callable[..., Any],
     status_path: Path,
@@ -55,29 +197,14 @@ async def run_batch(
         The path to the result file.
     """
     try:
-        # Set the status to "running"
-        status_path.write_text('\t'.join([Status.RUNNING.value, str(file_path)]), encoding='utf-8')
-
-        # Run the batch processing
-        loop = asyncio.get_event_loop()
-        result = await loop.run_in_executor(
-            None,
-            inference,
-            callback,
-            file_path,
-            out_dir,
-            dict(kwargs),
-        )
-
-        # Save the result and set the status to "done"
-        result_path = status_path.with_suffix(".json")
-        json.dump(result, result_path.open('w', encoding='utf-8'), indent=4, ensure_ascii=False)
-        status_path.write_text('\t'.join([Status.DONE.value, str(result_path)]), encoding='utf-8')
-        return str(result_path)
-    except Exception as e:
-        # Set the status to "failed"
-        status_path.write_text('\t'.join([Status.FAILED.value, str(e)]), encoding='utf-8')
+        saved = schedule_batch(callback, status_path, file_path, out_dir, **kwargs)
+    except queue.Full as e:
+        update_status(status_path, Status.FAILED, f"Server is busy: {e}")
+        return ""
+    except ValueError as e:
+        update_status(status_path, Status.FAILED, str(e))
         return ""
+    return await asyncio.wrap_future(saved)
 
 
 def run_batch_uri(
@@ -113,7 +240,7 @@ def run_batch_uri(
     """
     try:
         # Set the status to "running"
-        status_path.write_text('\t'.join([Status.RUNNING.value, uri]), encoding="utf-8")
+        update_status(status_path, Status.RUNNING, uri)
 
         # Run the batch processing
         result = callback(
@@ -121,7 +248,7 @@ def run_batch_uri(
             out_dir=out_dir,
             **kwargs,
         )
-        status_path.write_text('\t'.join([Status.DONE.value, uri]), encoding="utf-8")
+        update_status(status_path, Status.DONE, uri)
 
         return MESSAGE_SUCCESS(
             content={
@@ -132,7 +259,7 @@ def run_batch_uri(
 
     except Exception as e:
         # Set the status to "failed"
-        status_path.write_text('\t'.join([Status.FAILED.value, uri]), encoding="utf-8")
+        update_status(status_path, Status.FAILED, uri)
 
         # Return the error message
         return ERROR_PROCESS_FAILED(
@@ -143,12 +270,206 @@ def run_batch_uri(
         ).__dict__
 
 
+def batch_uri_item(
+    callback: Callable[..., Any],
+    index: int,
+    uri: Text,
+    out_dir: Path,
+    kwargs: Dict[Text, Any],
+)-> Dict:
+    """Run one URI of a fan-out, its failure is kept in the item"""
+    start = time.perf_counter()
+    item: Dict[Text, Any] = {"index": index, "uri": uri}
+    try:
+        item["result"] = callback(uri, out_dir=out_dir, **kwargs)
+        item["status"] = Status.DONE.value
+    except Exception as e:
+        item["error"] = str(e)
+        item["status"] = Status.FAILED.value
+    item["elapsed"] = round(time.perf_counter() - start, 3)
+    return item
+
+
+def batch_progress(
+    items: List[Dict],
+    total: int,
+)-> Text:
+    failed = sum(item["status"] == Status.FAILED.value for item in items)
+    return f"{len(items)}/{total} processed, {failed} failed"
+
+
+def batch_item_path(
+    status_path: Path,
+    index: int,
+)-> Path:
+    """Status path of the item `index` of a fan-out, its ID is `{id}.{index}`"""
+    return status_path.with_name(f"{status_path.stem}.{index}.status")
+
+
+def iter_batch_uris(
+    callback: Callable[..., Any],
+    uris: List[Text],
+    status_path: Path,
+    out_dir: Path,
+    parallel: int = 4,
+    client: Text = "",
+    priority: Union[Text, int] = "normal",
+    retry_interval: float = 0.05,
+    **kwargs: Dict[Text, Any],
+)-> Iterator[Dict]:
+    """Run the URIs on the scheduler of `callback` and yield their items
+    as they complete.
+
+    Every URI is a job of the scheduler with its own status
+    (`batch_item_path`), so the fan-out shares the bounded workers, the
+    priorities and the client caps of the other jobs. At most `parallel`
+    URIs of the batch are queued or running at once, the ones the full
+    scheduler refuses are retried every `retry_interval` seconds.
+
+    Each item has the `index` and `uri` of its input, its `status` (DONE
+    or FAILED), `result` or `error` and `elapsed` seconds. Every item is
+    appended to the partial results file `{id}.partial.jsonl` and the
+    status detail counts the processed ones. Stopping the iteration
+    cancels the URIs not started yet.
+
+    Raises
+    ------
+    queue.Full
+        If the scheduler can't take the first URI, nothing is started
+        and the batch should be answered `ERROR_SERVER_IS_BUSY`.
+    ValueError
+        If the priority is unknown.
+    """
+    scheduler = get_scheduler(callback)
+    total = len(uris)
+    pending = deque(enumerate(uris))
+    running: Dict[Future, Tuple[int, Text]] = {}
+
+    def finish_item(
+        index: int,
+        uri: Text,
+        future: Future,
+    )-> Dict:
+        """Item of a completed URI, recorded in its status
+
+        A DONE item is saved next to its status (`{id}.{index}.json`), the
+        result of the item ID, a FAILED one keeps its error as detail.
+        """
+        try:
+            item = future.result()
+        except Exception as e:
+            # e.g. a process of the pool died
+            item = {"index": index, "uri": uri, "error": str(e), "status": Status.FAILED.value, "elapsed": 0.0}
+
+        item_path = batch_item_path(status_path, index)
+        if item["status"] == Status.DONE.value:
+            result_path = item_path.with_suffix(".json")
+            atomic_write(result_path, json.dumps(item, indent=4, ensure_ascii=False, default=str))
+            update_status(item_path, Status.DONE, str(result_path))
+        else:
+            update_status(item_path, Status.FAILED, item["error"])
+        return item
+
+    def fill()-> None:
+        """Queue URIs up to `parallel` while the scheduler takes them"""
+        while pending and len(running) < parallel:
+            index, uri = pending[0]
+            try:
+                future = scheduler.submit(
+                    batch_uri_item,
+                    index,
+                    uri,
+                    out_dir,
+                    dict(kwargs),
+                    status_path=batch_item_path(status_path, index),
+                    detail=uri,
+                    client=client,
+                    priority=priority,
+                )
+            except queue.Full:
+                if index == 0:
+                    raise
+                # The batch is admitted, the URI is retried later
+                return
+            pending.popleft()
+            running[future] = (index, uri)
+
+    fill()
+    update_status(status_path, Status.RUNNING, batch_progress([], total))
+
+    def items()-> Iterator[Dict]:
+        done_items: List[Dict] = []
+        try:
+            with status_path.with_suffix(".partial.jsonl").open("w", encoding="utf-8") as partial:
+                while running or pending:
+                    if not running:
+                        # The scheduler is full of other jobs, wait for room
+                        time.sleep(retry_interval)
+                        fill()
+                        continue
+
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        item = finish_item(*running.pop(future), future)
+                        done_items.append(item)
+                        partial.write(json.dumps(item, ensure_ascii=False, default=str) + "\n")
+                        partial.flush()
+                        update_status(status_path, Status.RUNNING, batch_progress(done_items, total))
+                        yield item
+                    fill()
+        finally:
+            for future, (index, uri) in running.items():
+                if future.cancel():
+                    update_status(batch_item_path(status_path, index), Status.FAILED, "Cancelled")
+
+    return items()
+
+
+def finish_batch_uris(
+    id: Text,
+    status_path: Path,
+    items: List[Dict],
+    total: int,
+    elapsed: float = 0.0,
+)-> Dict:
+    """Save the aggregate of a fan-out and set the status of the batch.
+
+    The batch is DONE, with the aggregate file as result, unless every
+    URI failed.
+
+    Returns
+    -------
+    Dict
+        The aggregate with the items in the order of the URIs.
+    """
+    items = sorted(items, key=lambda item: item["index"])
+    failed = sum(item["status"] == Status.FAILED.value for item in items)
+    content = {
+        "id": id,
+        "total": total,
+        "done": len(items) - failed,
+        "failed": failed,
+        "elapsed": round(elapsed, 3),
+        "results": items,
+    }
+
+    if total and failed == len(items):
+        update_status(status_path, Status.FAILED, batch_progress(items, total))
+        return ERROR_PROCESS_FAILED(content=content).__dict__
+
+    result_path = status_path.with_suffix(".json")
+    atomic_write(result_path, json.dumps(content, indent=4, ensure_ascii=False, default=str))
+    update_status(status_path, Status.DONE, str(result_path))
+    return MESSAGE_SUCCESS(content=content).__dict__
+
+
 def run_batch_uris(
     callback: Callable[..., Any],
     uris: List[Text],
     id: Text,
     status_path: Path,
     out_dir: Path,
+    parallel: int = 0,
     **kwargs: Dict[Text, Any],
 )-> Dict:
     """Run a batch processing with multiple URIs.
@@ -166,6 +487,11 @@ def run_batch_uris(
         It will be updated with the status of the batch processing.
     out_dir : Path
         The path to the output directory.
+    parallel : int
+        0 to pass the whole list to `callback` at once. Otherwise the
+        callback is called with each URI on its scheduler, `parallel` of
+        them at once (see `iter_batch_uris`), and a failed URI doesn't fail
+        the others. `client` and `priority` in `kwargs` schedule them.
     kwargs : Dict[Text, Any]
         The parameters for the batch processing.
 
@@ -173,10 +499,23 @@ def run_batch_uris(
     -------
     Dict
         The result of the batch processing.
+        With `parallel`, the aggregate of `finish_batch_uris`.
     """
+    if parallel > 0:
+        start = time.perf_counter()
+        try:
+            items = list(iter_batch_uris(callback, uris, status_path, out_dir, parallel, **kwargs))
+        except queue.Full as e:
+            update_status(status_path, Status.FAILED, f"Server is busy: {e}")
+            return ERROR_SERVER_IS_BUSY(content={"id": id, "detail": str(e)}).__dict__
+        except ValueError as e:
+            update_status(status_path, Status.FAILED, str(e))
+            return ERROR_PROCESS_FAILED(content={"id": id, "error": str(e)}).__dict__
+        return finish_batch_uris(id, status_path, items, len(uris), time.perf_counter() - start)
+
     try:
         # Set the status to "running"
-        status_path.write_text('\t'.join([Status.RUNNING.value, str(uris)]), encoding="utf-8")
+        update_status(status_path, Status.RUNNING, str(uris))
 
         # Run the batch processing
         result = callback(
@@ -184,7 +523,7 @@ def run_batch_uris(
             out_dir=out_dir,
             **kwargs,
         )
-        status_path.write_text('\t'.join([Status.DONE.value, str(uris)]), encoding="utf-8")
+        update_status(status_path, Status.DONE, str(uris))
 
         return MESSAGE_SUCCESS(
             content={
@@ -195,7 +534,7 @@ def run_batch_uris(
 
     except Exception as e:
         # Set the status to "failed"
-        status_path.write_text('\t'.join([Status.FAILED.value, str(uris)]), encoding="utf-8")
+        update_status(status_path, Status.FAILED, str(uris))
 
         # Return the error message
         return ERROR_PROCESS_FAILED(
@@ -203,4 +542,4 @@ def run_batch_uris(
                 "id": id,
                 'error': str(e),
             }
-        ).__dict__
\ No newline at end of file
+        ).__dict__
@@ -5,9 +5,13 @@
 # Sukbong Kwon (Galois)
 
 import json
+import time
+import asyncio
 import uuid
+import queue
 from pathlib import Path
-from typing import Dict, Text, Any, Union
+from concurrent.futures import Future
+from typing import Dict, Text, Any, Iterator, List, Union
 from pydantic import BaseModel
 
 from fastapi import (
@@ -16,28 +20,56 @@ from fastapi import (
     UploadFile,
     Depends,
 )
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 
 from saturn.backend import (
     set_status_path,
     upload_file,
-    run_batch,
+    schedule_batch,
+    schedule_batch_uri,
+    pop_scheduling,
     run_batch_uri,
+    run_batch_uris,
+    iter_batch_uris,
+    finish_batch_uris,
+    batch_item_path,
     get_result,
+    get_job_store,
+    update_status,
+    Status,
 )
 
+from saturn.utils.response import StatusResponse
 from saturn.utils.status_code import (
     MESSAGE_SUCCESS,
     MESSAGE_PROCESS_RUNNING_IN_THE_BACKGROUND,
     ERROR_PROCESS_FAILED,
+    ERROR_SERVER_IS_BUSY,
+    ERROR_INVALID_KEY,
 )
 
+
+def rejected(
+    id: Text,
+    status_path: Path,
+    error: Exception,
+)-> JSONResponse:
+    """Fail a job the scheduler refused and build the response"""
+    if isinstance(error, queue.Full):
+        update_status(status_path, Status.FAILED, f"Server is busy: {error}")
+        return StatusResponse(ERROR_SERVER_IS_BUSY(content={"id": id, "detail": str(error)}))
+
+    update_status(status_path, Status.FAILED, str(error))
+    return StatusResponse(ERROR_INVALID_KEY(content={"id": id, "detail": str(error)}))
+
+
 def request_upload(
     engine: Any,
     exp: Union[Text, Path],
     background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     request_body: BaseModel = Depends(),
+    client: Text = "",
 )-> JSONResponse:
     """Upload a file to the server and run the background task.
 
@@ -48,11 +80,16 @@ def request_upload(
     exp : Text
         The path to the experiment folder.
     background_tasks : BackgroundTasks
-        The background tasks to run. (FASTAPI class)
+        Not used anymore, the task is queued on the scheduler of the engine
+        (see `saturn.backend.scheduler`). Kept for the existing routes.
     file : UploadFile
         The file to upload. (FASTAPI class)
     request_body : BaseModel
         The request body. (pydantic class)
+        Its `client` and `priority` fields, if any, schedule the task.
+    client : Text
+        The client key when the body has none, e.g. the `X-Client-Id` header.
+        Clients take turns on the workers (see `saturn.backend.scheduler`).
     """
     # Generate a unique ID for the request
     id = uuid.uuid4().hex
@@ -68,24 +105,30 @@ def request_upload(
     status = upload_file(file, status_path, file_path)
     if  status: JSONResponse(status)
 
-    # Run the background task
-    background_tasks.add_task(
-        run_batch,
-        engine,
-        status_path,
-        file_path,
-        file_path.parent,
-        **request_body.dict(),
-    )
+    # Queue the task, the scheduler runs it in the background
+    kwargs = request_body.dict()
+    body_client, priority = pop_scheduling(kwargs)
+    try:
+        schedule_batch(
+            engine,
+            status_path,
+            file_path,
+            file_path.parent,
+            client=body_client or client,
+            priority=priority,
+            **kwargs,
+        )
+    except (queue.Full, ValueError) as e:
+        return rejected(id, status_path, e)
 
     # Return the response
-    return JSONResponse(
+    return StatusResponse(
         MESSAGE_PROCESS_RUNNING_IN_THE_BACKGROUND(
             content={
                 "id": id,
                 "detail": f"File {file.filename} is being processed in the background",
             }
-        ).__dict__
+        )
     )
 
 
@@ -134,7 +177,23 @@ def request_run(
         **request_body.dict(),
     )
     result['model'] = model_info
-    return JSONResponse(result)
+    return StatusResponse(result)
+
+
+def result_status_path(
+    id: Text,
+    exp: Path,
+)-> Path:
+    """Status path of a request ID
+
+    An ID `{id}.{index}` that isn't a request of its own is the item
+    `index` of the fan-out `id` (see `iter_batch_uris`).
+    """
+    status_path = exp / id / f"{id}.status"
+    batch, _, index = id.rpartition(".")
+    if batch and index.isdigit() and get_job_store().get(status_path) is None:
+        return batch_item_path(exp / batch / f"{batch}.status", int(index))
+    return status_path
 
 
 def request_result(
@@ -164,40 +223,70 @@ def request_result(
     ```
     Status.DONE    /path/to/result.json
     ```
+    The ID of an item of a fan-out, `{id}.{index}`, gives the result of
+    that URI.
     """
     # Define the status path
-    status_path = exp / id / f"{id}.status"
+    status_path = result_status_path(id, exp)
 
     # Get the result from the status file
     result = get_result(id, status_path)
 
     # Check if the result is valid
     if result.get("code", 0) != 700:
-        return JSONResponse(result)
+        return StatusResponse(result)
 
     # Return response
     try:
         result_path = result.get('content', {}).get('result', '')
         data = json.load(Path(result_path).open())
 
-        return JSONResponse(
+        return StatusResponse(
             MESSAGE_SUCCESS(
                 model=model_info,
                 content={
                     "id": id,
                     "result": data,
                 }
-            ).__dict__
+            )
         )
     except Exception as e:
-        return JSONResponse(
+        return StatusResponse(
             ERROR_PROCESS_FAILED(
                 content={
                     "id": id,
                     "error": str(e),
                 }
-            ).__dict__
+            )
+        )
+
+
+def submit_uri(
+    engine: Any,
+    uri: Text,
+    id: Text,
+    exp: Path,
+    kwargs: Dict[Text, Any],
+)-> Union[Future, JSONResponse]:
+    """Queue the job of `request_uri`, the rejection response if refused"""
+    # Initialize status
+    status_path = set_status_path(id, uri, exp)
+
+    # Run batch processing on the scheduler
+    client, priority = pop_scheduling(kwargs)
+    try:
+        return schedule_batch_uri(
+            engine,
+            uri,
+            id,
+            status_path,
+            exp / id,
+            client=client,
+            priority=priority,
+            **kwargs,
         )
+    except (queue.Full, ValueError) as e:
+        return rejected(id, status_path, e)
 
 
 def request_uri(
@@ -210,6 +299,10 @@ def request_uri(
 )-> JSONResponse:
     """Run a batch processing with the given URI.
 
+    The calling thread is blocked while the job waits for its turn on the
+    scheduler and runs, call it from a sync route (run in the threadpool)
+    and use `request_uri_async` in an `async def` route.
+
     Parameters
     ----------
     uri : Text
@@ -218,6 +311,8 @@ def request_uri(
         The ID of the request.
     kwargs : Dict[Text, Any]
         The parameters for the batch processing.
+        `client` and `priority` schedule it with the other jobs of the
+        engine, the request waits for its turn.
 
     Returns
     -------
@@ -227,17 +322,123 @@ def request_uri(
     # Generate ID (uuid)
     if not id: id = uuid.uuid4().hex
 
+    response = submit_uri(engine, uri, id, exp, kwargs)
+    if isinstance(response, JSONResponse):
+        return response
+
+    result = response.result()
+    result['model'] = model_info
+    return StatusResponse(result)
+
+
+async def request_uri_async(
+    engine: Any,
+    uri: Text,
+    id: Text,
+    exp: Path,
+    model_info: Dict,
+    **kwargs: Dict[Text, Any],
+)-> JSONResponse:
+    """`request_uri` for `async def` routes, the job is awaited"""
+    if not id: id = uuid.uuid4().hex
+
+    response = submit_uri(engine, uri, id, exp, kwargs)
+    if isinstance(response, JSONResponse):
+        return response
+
+    result = await asyncio.wrap_future(response)
+    result['model'] = model_info
+    return StatusResponse(result)
+
+
+def request_uris(
+    engine: Any,
+    uris: List[Text],
+    id: Text,
+    exp: Path,
+    model_info: Dict,
+    parallel: int = 4,
+    stream: bool = False,
+    **kwargs: Dict[Text, Any],
+)-> Union[JSONResponse, StreamingResponse]:
+    """Run a batch processing with the given URIs, `parallel` at once.
+
+    Parameters
+    ----------
+    uris : List[Text]
+        The URIs to the input files.
+    id : Text
+        The ID of the request.
+    parallel : int
+        Number of URIs of the batch queued or running at once on the
+        scheduler of the engine, shared with the other jobs.
+    stream : bool
+        Send each URI as a line of NDJSON when it completes, then the
+        aggregate, instead of the aggregate only.
+    kwargs : Dict[Text, Any]
+        The parameters for the batch processing.
+        `client` and `priority` schedule the URIs like `request_uri`.
+
+    Returns
+    -------
+    Dict
+        The aggregate with the status, result or error and time of each URI.
+        `ERROR_SERVER_IS_BUSY` if the scheduler can't take the batch.
+    """
+    # Generate ID (uuid)
+    if not id: id = uuid.uuid4().hex
+
     # Initialize status
-    status_path = set_status_path(id, uri, exp)
+    status_path = set_status_path(id, f"{len(uris)} URIs", exp)
+    parallel = max(parallel, 1)
 
-    # Run batch processing
-    result = run_batch_uri(
-        engine,
-        uri,
-        id,
-        status_path,
-        exp / id,
-        **kwargs,
+    if not stream:
+        result = run_batch_uris(engine, uris, id, status_path, exp / id, parallel, **kwargs)
+        result['model'] = model_info
+        return StatusResponse(result)
+
+    start = time.perf_counter()
+    try:
+        batch = iter_batch_uris(engine, uris, status_path, exp / id, parallel, **kwargs)
+    except (queue.Full, ValueError) as e:
+        return rejected(id, status_path, e)
+
+    def lines()-> Iterator[bytes]:
+        items = []
+        for item in batch:
+            items.append(item)
+            yield json.dumps(item, ensure_ascii=False, default=str).encode("utf-8") + b"\n"
+        result = finish_batch_uris(id, status_path, items, len(uris), time.perf_counter() - start)
+        result['model'] = model_info
+        yield json.dumps(result, ensure_ascii=False, default=str).encode("utf-8") + b"\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+def request_jobs(
+    status: Text = "",
+    limit: int = 100,
+)-> JSONResponse:
+    """List the jobs, most recently updated first.
+
+    Parameters
+    ----------
+    status : Text
+        Only the jobs with this status (e.g. `RUNNING`), all of them if empty.
+    limit : int
+        Maximum number of jobs.
+
+    Returns
+    -------
+    Dict
+        The jobs with their status, timestamps and result.
+    """
+    jobs = get_job_store().jobs(status or None, limit)
+    return StatusResponse(
+        MESSAGE_SUCCESS(
+            content={
+                "size": len(jobs),
+                "jobs": [job.to_dict() for job in jobs],
+            }
+        )
     )
-    result['model'] = model_info
-    return JSONResponse(result)
\ No newline at end of file
@@ -12,6 +12,8 @@ from saturn.utils.status_code import (
 )
 from .status import Status
 from .status import check_status
+from ..jobs import get_job_store
+from ..scheduler import queue_position
 
 def get_result(
     id: Text,
@@ -25,7 +27,7 @@ def get_result(
     id : Text
         The id of the batch processing.
     status_path : Path
-        The path of the status file.
+        The path of the status file, the key of the job in the job store.
     kwargs : Dict
         The parameters for the batch processing.
 
@@ -35,7 +37,8 @@ def get_result(
         The result of the batch processing.
     """
     try:
-        if not status_path.exists():
+        job = get_job_store().get(status_path)
+        if job is None:
             return ERROR_PROCESS_FAILED(
                 content={
                     "id": id,
@@ -43,8 +46,10 @@ def get_result(
                 }
             ).__dict__
 
-        value, result_path = status_path.read_text().split('\t')
-        status = Status(value)
+        status, result_path = Status(job.status), job.detail
+
+        if status in (Status.PENDING, Status.WAITING):
+            return check_status(id, status, result_path, queue_position(id))
 
         if status != Status.DONE:
             return check_status(id, status, result_path)
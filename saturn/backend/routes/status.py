@@ -5,9 +5,10 @@
 # Sukbong Kwon (Galois)
 
 from enum import Enum, auto
-from typing import Dict, Text
+from typing import Dict, Optional, Text
 from pathlib import Path
 from saturn.utils.status_code import *
+from ..jobs import get_job_store
 
 # Define status: the status of processing
 class Status(Enum):
@@ -25,6 +26,7 @@ def check_status(
     id: Text,
     status: Status,
     detail: Text = "",
+    position: Optional[int] = None,
 )-> Dict:
     """Check status of the request with target status
 
@@ -36,6 +38,8 @@ def check_status(
         Current status of the request
     detail : Text
         Detail message for the status
+    position : Optional[int]
+        Place of a PENDING or WAITING job in the queue, reported if given
 
     Returns
     -------
@@ -63,14 +67,14 @@ def check_status(
         ).__dict__
 
     elif status == Status.WAITING:
-        return MESSAGE_PROCESS_WAITING(
-            content={"id": id, "detail": f"File {id} is waiting for the process"}
-        ).__dict__
+        content = {"id": id, "detail": f"File {id} is waiting for the process"}
+        if position is not None: content["position"] = position
+        return MESSAGE_PROCESS_WAITING(content=content).__dict__
 
     elif status == Status.PENDING:
-        return MESSAGE_PROCESS_PENDING(
-            content={"id": id, "detail": f"File {id} is pending for the process"}
-        ).__dict__
+        content = {"id": id, "detail": f"File {id} is pending for the process"}
+        if position is not None: content["position"] = position
+        return MESSAGE_PROCESS_PENDING(content=content).__dict__
 
     else:
         return ERROR_INVALID_TASK(
@@ -78,6 +82,15 @@ def check_status(
         ).__dict__
 
 
+def update_status(
+    status_path: Path,
+    status: Status,
+    detail: Text = "",
+)-> None:
+    """Record the new status of the job of `status_path` in the job store"""
+    get_job_store().update(status_path, status.value, detail)
+
+
 def set_status_path(
     id: Text,
     filename: Text,
@@ -99,6 +112,6 @@ def set_status_path(
     """
     status_path = our_dir / id / f"{id}.status"
     status_path.parent.mkdir(parents=True, exist_ok=True)
-    status_path.write_text(f"{Status.READY.value}\t{str(filename)}", encoding="utf-8")
+    get_job_store().create(status_path, Status.READY.value, str(filename))
 
     return status_path
\ No newline at end of file
@@ -7,7 +7,7 @@
 import shutil
 from fastapi import File, UploadFile
 from pathlib import Path
-from .status import Status, set_status_path
+from .status import Status, set_status_path, update_status
 from typing import Text, Dict, Union, Any, Tuple
 from saturn.utils.status_code import ERROR_UPLOAD_FAILED
 
@@ -61,9 +61,9 @@ def upload_file(
         file_path.parent.mkdir(parents=True, exist_ok=True)
         with open(file_path, "wb") as buffer:
             shutil.copyfileobj(file.file, buffer)
-        status_path.write_text(f"{Status.UPLOADED.value}\t{str(file_path)}", encoding="utf-8")
+        update_status(status_path, Status.UPLOADED, str(file_path))
     except Exception as e:
-        status_path.write_text(f"{Status.FAILED.value}\t{str(e)}", encoding="utf-8")
+        update_status(status_path, Status.FAILED, str(e))
         return ERROR_UPLOAD_FAILED(
             content={
                 "detail": f"Failed to upload {file.filename} with {e}",
@@ -0,0 +1,468 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Copyright (c) 2024- SATURN
+# AUTHORS:
+# Sukbong Kwon (Galois)
+
+# Bounded scheduler of the background jobs
+#
+# Each engine gets a pool of `workers` threads or processes and a queue of at
+# most `max_queue` jobs in front of it. An accepted job is PENDING, WAITING
+# while it is queued behind busy workers, and RUNNING once a worker takes it.
+# Submitting to a full scheduler raises `queue.Full` so the routes can answer
+# `ERROR_SERVER_IS_BUSY`.
+#
+# Jobs are queued by priority class, then by client. The highest class goes
+# first and, within a class, clients take turns (round robin), so a client
+# with thousands of jobs doesn't starve the others. Clients may be capped in
+# running and queued jobs.
+#
+# The lock only guards the queues and the counters, statuses are written
+# after it is released so a slow job store (fsync, a busy SQLite database)
+# doesn't serialize the submissions and completions.
+
+import queue
+import threading
+import multiprocessing
+from pathlib import Path
+from collections import deque, OrderedDict
+from dataclasses import dataclass, field
+from concurrent.futures import Executor, Future, ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Any, Callable, Deque, Dict, Iterable, List, Optional, Text, Tuple, Union
+
+from .routes.status import Status, update_status
+from .jobs import job_id
+
+# Priority classes, lower runs first
+PRIORITIES = {"high": 0, "normal": 1, "low": 2}
+
+# Header of the client key, when it is not in the request body
+CLIENT_HEADER = "X-Client-Id"
+
+# Statuses written by the scheduler, in the order a job goes through them
+STAGES = (Status.PENDING, Status.WAITING, Status.RUNNING)
+
+
+# Engine of a worker process, set by `init_worker`
+worker_engine: Any = None
+
+
+def init_worker(
+    engine: Any,
+)-> None:
+    global worker_engine
+    worker_engine = engine
+
+
+def call_in_worker(
+    fn: Callable[..., Any],
+    *args: Any,
+)-> Any:
+    return fn(worker_engine, *args)
+
+
+def pop_scheduling(
+    kwargs: Dict[Text, Any],
+)-> Tuple[Text, Text]:
+    """Take `client` and `priority` out of the parameters of a request body"""
+    client = kwargs.pop("client", None) or ""
+    priority = kwargs.pop("priority", None) or "normal"
+    return str(client), str(priority)
+
+
+def priority_class(
+    priority: Union[Text, int],
+)-> int:
+    if isinstance(priority, int):
+        return priority
+    if priority not in PRIORITIES:
+        raise ValueError(f"Unknown priority '{priority}', choose from {list(PRIORITIES)}")
+    return PRIORITIES[priority]
+
+
+@dataclass
+class ScheduledJob:
+    fn: Callable[..., Any]
+    args: Tuple
+    status_path: Path
+    detail: Text
+    future: Future
+    client: Text = ""
+    priority: int = PRIORITIES["normal"]
+    # In the queue of the scheduler, IDs given by the callers may repeat
+    queued: bool = False
+    # Last of `STAGES` written, statuses are written out of the lock of the
+    # scheduler and must not go back, e.g. WAITING after RUNNING
+    stage: int = -1
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+    @property
+    def id(
+        self,
+    )-> Text:
+        return job_id(self.status_path)
+
+
+class Scheduler:
+    def __init__(
+        self,
+        engine: Any,
+        workers: int = 2,
+        max_queue: int = 32,
+        mode: Text = "thread",
+        client_max_running: int = 0,
+        client_max_queue: int = 0,
+    )-> None:
+        """Bounded queue and pool of workers for the jobs of an engine
+
+        Parameters
+        ----------
+        engine : Any
+            Engine given as the first argument to every job
+        workers : int
+            Number of jobs running at once
+        max_queue : int
+            Number of accepted jobs waiting for a worker
+        mode : Text
+            `thread` or `process`. Processes are forked with the engine
+            and run the jobs without the GIL, the job functions and their
+            arguments must be picklable.
+        client_max_running : int
+            Jobs of a client running at once, 0 for no limit
+        client_max_queue : int
+            Jobs of a client waiting for a worker, 0 for no limit
+        """
+        if mode not in ("thread", "process"):
+            raise ValueError(f"Unknown executor mode '{mode}', choose from ['thread', 'process']")
+
+        self.engine = engine
+        self.workers = max(workers, 1)
+        self.max_queue = max_queue
+        self.mode = mode
+        self.client_max_running = client_max_running
+        self.client_max_queue = client_max_queue
+        self.running = 0
+        self.queued = 0
+        # {priority: {client: jobs}}, clients in their turn order
+        self._queues: Dict[int, "OrderedDict[Text, Deque[ScheduledJob]]"] = {}
+        self._client_running: Dict[Text, int] = {}
+        self._lock = threading.RLock()
+        self._pool: Optional[Executor] = None
+
+    @property
+    def pool(
+        self,
+    )-> Executor:
+        # Jobs are submitted out of the lock, it still guards the creation
+        with self._lock:
+            if self._pool is None:
+                if self.mode == "process":
+                    self._pool = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context("fork"),
+                        initializer=init_worker,
+                        initargs=(self.engine,),
+                    )
+                else:
+                    self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="saturn")
+            return self._pool
+
+    def submit(
+        self,
+        fn: Callable[..., Any],
+        *args: Any,
+        status_path: Path,
+        detail: Text = "",
+        client: Text = "",
+        priority: Union[Text, int] = "normal",
+    )-> Future:
+        """Queue `fn(engine, *args)` for the job of `status_path`
+
+        Parameters
+        ----------
+        client : Text
+            Key of the client for the fair share and its caps
+        priority : Union[Text, int]
+            One of `PRIORITIES`
+
+        Returns
+        -------
+        Future
+            Result of `fn`
+
+        Raises
+        ------
+        queue.Full
+            If `workers` jobs are running and `max_queue` are waiting,
+            or the client already has `client_max_queue` waiting jobs
+        ValueError
+            If the priority is unknown
+        """
+        job = ScheduledJob(
+            fn, args, Path(status_path), detail, Future(), client, priority_class(priority),
+        )
+        with self._lock:
+            if self.running + self.queued >= self.workers + self.max_queue:
+                raise queue.Full(f"{self.running} jobs are running and {self.queued} are waiting")
+            if self.client_max_queue and self._client_queued(client) >= self.client_max_queue:
+                raise queue.Full(f"Client '{client}' already has {self.client_max_queue} waiting jobs")
+
+            self._queues.setdefault(job.priority, OrderedDict()).setdefault(client, deque()).append(job)
+            job.queued = True
+            self.queued += 1
+            started = self._dispatch()
+
+        try:
+            self._write(job, Status.PENDING)
+        except Exception:
+            self._start(started)
+            # Withdraw the job unless a worker already took it
+            if job.future.cancel():
+                raise
+            return job.future
+
+        self._start(started)
+        if job.queued:
+            self._write(job, Status.WAITING)
+        return job.future
+
+    def _write(
+        self,
+        job: ScheduledJob,
+        status: Status,
+    )-> None:
+        """Write a status of `STAGES` unless the job is already past it"""
+        stage = STAGES.index(status)
+        with job.lock:
+            if stage > job.stage:
+                update_status(job.status_path, status, job.detail)
+                job.stage = stage
+
+    def _client_queued(
+        self,
+        client: Text,
+    )-> int:
+        return sum(len(clients.get(client, ())) for clients in self._queues.values())
+
+    def _next(
+        self,
+    )-> Optional[ScheduledJob]:
+        """Job of the next client in turn in the highest priority class"""
+        for priority in sorted(self._queues):
+            clients = self._queues[priority]
+            for client in list(clients):
+                if (self.client_max_running
+                        and self._client_running.get(client, 0) >= self.client_max_running):
+                    continue
+                jobs = clients[client]
+                job = jobs.popleft()
+                if jobs:
+                    clients.move_to_end(client)
+                else:
+                    del clients[client]
+                if not clients:
+                    del self._queues[priority]
+                return job
+        return None
+
+    def _dispatch(
+        self,
+    )-> List[ScheduledJob]:
+        """Take queued jobs while workers are free (holding the lock)
+
+        The jobs are counted as running, `_start` hands them to the pool
+        once the lock is released.
+        """
+        started = []
+        while self.running < self.workers:
+            job = self._next()
+            if job is None:
+                break
+            self.queued -= 1
+            job.queued = False
+            if not job.future.set_running_or_notify_cancel():
+                continue
+            self.running += 1
+            self._client_running[job.client] = self._client_running.get(job.client, 0) + 1
+            started.append(job)
+        return started
+
+    def _start(
+        self,
+        jobs: Iterable[ScheduledJob],
+    )-> None:
+        """Mark the dispatched jobs RUNNING and submit them (without the lock)
+
+        Never raises, a job that can't start fails through its future and
+        its worker goes to the next queued job.
+        """
+        jobs = deque(jobs)
+        while jobs:
+            job = jobs.popleft()
+            try:
+                # Before the submission, so the final status of the job comes last
+                self._write(job, Status.RUNNING)
+                if self.mode == "process":
+                    future = self.pool.submit(call_in_worker, job.fn, *job.args)
+                else:
+                    future = self.pool.submit(job.fn, self.engine, *job.args)
+            except Exception as e:
+                # e.g. a process of the pool died or the status can't be written
+                with self._lock:
+                    self._finished(job)
+                    jobs.extend(self._dispatch())
+                job.future.set_exception(e)
+                continue
+            future.add_done_callback(lambda future, job=job: self._done(job, future))
+
+    def _finished(
+        self,
+        job: ScheduledJob,
+    )-> None:
+        self.running -= 1
+        self._client_running[job.client] -= 1
+        if not self._client_running[job.client]:
+            del self._client_running[job.client]
+
+    def _done(
+        self,
+        job: ScheduledJob,
+        future: Future,
+    )-> None:
+        with self._lock:
+            self._finished(job)
+            started = self._dispatch()
+        self._start(started)
+
+        error = future.exception()
+        if error is not None:
+            job.future.set_exception(error)
+        else:
+            job.future.set_result(future.result())
+
+    def position(
+        self,
+        id: Text,
+    )-> Optional[int]:
+        """Estimated place (from 1) of a queued job in the dispatch order
+
+        Jobs of higher classes go first, then clients take turns: a job
+        that is the i-th of its client starts after i jobs of each other
+        client of its class (i + 1 for the clients whose turn comes first).
+        Caps are not taken into account. None if the job isn't queued,
+        the first queued job of the ID if the callers reused it.
+        """
+        with self._lock:
+            job = next((
+                job
+                for clients in self._queues.values()
+                for jobs in clients.values()
+                for job in jobs if job.id == id
+            ), None)
+            if job is None:
+                return None
+
+            ahead = sum(
+                len(jobs)
+                for priority, clients in self._queues.items() if priority < job.priority
+                for jobs in clients.values()
+            )
+            clients = self._queues[job.priority]
+            index = clients[job.client].index(job)
+            before = True
+            for client, jobs in clients.items():
+                if client == job.client:
+                    before = False
+                    ahead += index
+                else:
+                    ahead += min(len(jobs), index + 1 if before else index)
+            return ahead + 1
+
+    def info(
+        self,
+    )-> Dict[Text, Any]:
+        with self._lock:
+            clients = {
+                client: {"running": running, "queued": 0}
+                for client, running in self._client_running.items()
+            }
+            for priority in self._queues.values():
+                for client, jobs in priority.items():
+                    clients.setdefault(client, {"running": 0, "queued": 0})["queued"] += len(jobs)
+
+        return {
+            "mode": self.mode,
+            "workers": self.workers,
+            "running": self.running,
+            "queued": self.queued,
+            "max_queue": self.max_queue,
+            "clients": clients,
+        }
+
+    def shutdown(
+        self,
+    )-> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+# Options of the schedulers created by `get_scheduler`
+scheduler_options: Dict[Text, Any] = {
+    "workers": 2,
+    "max_queue": 32,
+    "mode": "thread",
+    "client_max_running": 0,
+    "client_max_queue": 0,
+}
+schedulers: Dict[Any, Scheduler] = {}
+
+
+def configure_scheduler(
+    workers: int = 2,
+    max_queue: int = 32,
+    mode: Text = "thread",
+    client_max_running: int = 0,
+    client_max_queue: int = 0,
+)-> None:
+    """Options of the schedulers, e.g. from `Setting.workers`
+
+    Only schedulers created afterwards use them.
+    """
+    if mode not in ("thread", "process"):
+        raise ValueError(f"Unknown executor mode '{mode}', choose from ['thread', 'process']")
+    scheduler_options.update(
+        workers=workers,
+        max_queue=max_queue,
+        mode=mode,
+        client_max_running=client_max_running,
+        client_max_queue=client_max_queue,
+    )
+
+
+def get_scheduler(
+    engine: Any,
+)-> Scheduler:
+    """Scheduler of `engine`, created on first use
+
+    A bound method is a new object on every access, it is known by its
+    object and function instead.
+    """
+    if hasattr(engine, "__self__") and hasattr(engine, "__func__"):
+        key = (id(engine.__self__), engine.__func__)
+    else:
+        key = id(engine)
+    scheduler = schedulers.get(key)
+    if scheduler is None:
+        scheduler = schedulers[key] = Scheduler(engine, **scheduler_options)
+    return scheduler
+
+
+def queue_position(
+    id: Text,
+)-> Optional[int]:
+    """Place of a queued job in the queue of its scheduler"""
+    for scheduler in list(schedulers.values()):
+        position = scheduler.position(id)
+        if position is not None:
+            return position
+    return None
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Copyright (c) 2024- SATURN
+# AUTHORS:
+# Sukbong Kwon (Galois)
+
+import re
+import json
+from typing import Any, Dict, Text, Tuple, Mapping, Optional
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# orjson and json disagree on floats written with an exponent (1e+16 / 1e16)
+# and on 1e-05 which orjson writes as 0.00001. `null` may come from NaN,
+# which json refuses. Outputs with such a value are encoded again with json,
+# a string that only looks like one costs the slower path.
+EXPONENT = re.compile(rb"e[-\d]")
+NUMBER = frozenset(b"0123456789.-")
+VALUE_START = frozenset(b":,[")
+
+# {(status class, code, message): b'{"code":...,"message":...'}
+prefixes: Dict[Tuple[type, Any, Any], bytes] = {}
+
+
+def same_as_json(
+    data: bytes,
+)-> bool:
+    """Whether json would write the output of orjson the same way"""
+    if b"null" in data or b"0.0000" in data:
+        return False
+
+    # Literal scans are fast, the few `e` followed by a digit are checked
+    # to be inside a number rather than a string like a hex ID
+    for match in EXPONENT.finditer(data):
+        end = start = match.start()
+        while start > 0 and data[start - 1] in NUMBER:
+            start -= 1
+        if start < end and (start == 0 or data[start - 1] in VALUE_START):
+            return False
+    return True
+
+
+def encode_json(
+    content: Any,
+)-> bytes:
+    """Encode `content` exactly like `JSONResponse` does, faster with orjson"""
+    if orjson is not None:
+        try:
+            data = orjson.dumps(content)
+            if same_as_json(data):
+                return data
+        except TypeError:
+            pass
+
+    return json.dumps(
+        content,
+        ensure_ascii=False,
+        allow_nan=False,
+        indent=None,
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+
+def encode_status(
+    status: Any,
+)-> bytes:
+    """Encode a status dataclass of `status_code` like `encode_json(status.__dict__)`
+
+    `code` and `message` are the same for every response of a status, so
+    they are encoded once and only the other fields are encoded per call.
+    """
+    fields = vars(status)
+    keys = iter(fields)
+    if next(keys, None) != "code" or next(keys, None) != "message":
+        return encode_json(fields)
+
+    key = (type(status), status.code, status.message)
+    prefix = prefixes.get(key)
+    if prefix is None:
+        prefix = prefixes[key] = encode_json(
+            {"code": status.code, "message": status.message}
+        )[:-1]
+
+    parts = [prefix]
+    for name in keys:
+        value = fields[name]
+        parts.append(b',"%s":%s' % (
+            name.encode(),
+            b"null" if value is None else encode_json(value),
+        ))
+    parts.append(b"}")
+    return b"".join(parts)
+
+
+class StatusResponse(JSONResponse):
+    def __init__(
+        self,
+        content: Any,
+        status_code: int = 200,
+        headers: Optional[Mapping[Text, Text]] = None,
+        media_type: Optional[Text] = None,
+        background: Any = None,
+    )-> None:
+        """JSONResponse of a status dataclass (e.g. `MESSAGE_SUCCESS(...)`) or a dict
+
+        The body is byte for byte the one of `JSONResponse(status.__dict__)`.
+        """
+        super().__init__(content, status_code, headers, media_type, background)
+
+    def render(
+        self,
+        content: Any,
+    )-> bytes:
+        if isinstance(content, dict):
+            return encode_json(content)
+        return encode_status(content)
@@ -4,10 +4,85 @@
 # AUTHORS:
 # Sukbong Kwon (Galois)
 
+import os
 import json
+import uuid
 from typing import Dict, Any, Union, Text, List, Optional
 from pathlib import Path
 
+# How far `atomic_write` goes to make a write survive a crash
+#   none  atomic for readers, the data may still be in the page cache
+#   file  fsync the file before renaming it, its content is on disk
+#   full  also fsync the directory, the rename itself is on disk
+FSYNC_POLICIES = ("none", "file", "full")
+fsync_policy = "file"
+
+
+def set_fsync_policy(
+    policy: Text,
+)-> None:
+    """Default fsync policy of `atomic_write`"""
+    global fsync_policy
+    if policy not in FSYNC_POLICIES:
+        raise ValueError(f"Unknown fsync policy '{policy}', choose from {list(FSYNC_POLICIES)}")
+    fsync_policy = policy
+
+
+def atomic_write(
+    filename: Union[Text, Path],
+    data: Union[Text, bytes],
+    fsync: Optional[Text] = None,
+)-> Path:
+    """Replace the content of a file at once
+
+    The data is written to a temporary file in the same directory, which is
+    then renamed over `filename`, so readers see either the old or the new
+    content but never a partial one.
+
+    Parameters
+    ----------
+    filename : Union[Text, Path]
+        File to write
+    data : Union[Text, bytes]
+        Content, text is encoded in UTF-8
+    fsync : Optional[Text], optional
+        One of `FSYNC_POLICIES`, by default the one of `set_fsync_policy`
+
+    Returns
+    -------
+    Path
+        Filename
+    """
+    fsync = fsync or fsync_policy
+    if fsync not in FSYNC_POLICIES:
+        raise ValueError(f"Unknown fsync policy '{fsync}', choose from {list(FSYNC_POLICIES)}")
+
+    path = Path(filename)
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+
+    # Created like `open(..., "w")` would, with the permissions of the umask
+    temp = path.with_name(f".{path.name}.{uuid.uuid4().hex[:8]}.tmp")
+    fd = os.open(temp, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            if fsync != "none":
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(temp, path)
+    except BaseException:
+        temp.unlink(missing_ok=True)
+        raise
+
+    if fsync == "full":
+        fd = os.open(path.parent, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+    return path
+
 
 def save_json(
     data: Union[Dict, List],
@@ -32,5 +107,5 @@ def save_json(
     """
     data['result_path'] = str(filename)
     Path(filename).parent.mkdir(parents=True, exist_ok=True)
-    json.dump(data, open(filename, "w"), indent=indent, ensure_ascii=False)
+    atomic_write(filename, json.dumps(data, indent=indent, ensure_ascii=False))
     return filename
\ No newline at end of file
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Copyright (c) 2024- SATURN
+# AUTHORS:
+# Sukbong Kwon (Galois)
+
+"""
+Throughput of the status and result writes for each durability level
+
+How to run
+python scripts/bench_atomic_write.py --count 500 --dir exp/bench
+
+`write_text` is the plain overwrite used before `atomic_write`, the other
+rows are the fsync policies of `saturn.utils.save.atomic_write`. Run it on
+the disk of the experiment folder, fsync costs depend on the device.
+"""
+
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+from pathlib import Path
+from typing import Callable, Dict, Text
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from saturn.utils.save import atomic_write, FSYNC_POLICIES
+
+
+def bench(
+    write: Callable[[Path, Text], None],
+    folder: Path,
+    data: Text,
+    count: int,
+)-> Dict[Text, float]:
+    """Overwrite `count` times the files of `count / 10` jobs"""
+    paths = [folder / f"job{i}.status" for i in range(max(count // 10, 1))]
+    start = time.perf_counter()
+    for i in range(count):
+        write(paths[i % len(paths)], data)
+    elapsed = time.perf_counter() - start
+    return {
+        "writes/s": count / elapsed,
+        "ms/write": elapsed / count * 1000,
+        "MB/s": count * len(data.encode("utf-8")) / elapsed / 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the durability levels of the writes")
+    parser.add_argument("-n", "--count", type=int, default=500, help="Writes per level")
+    parser.add_argument("-d", "--dir", type=str, default=None, help="Folder on the disk to test")
+    args = parser.parse_args()
+
+    root = Path(tempfile.mkdtemp(dir=args.dir))
+    payloads = {
+        "status": "RUNNING\t/path/to/exp/0123456789abcdef/input.wav",
+        "result": json.dumps(
+            {"segments": [{"start": i, "end": i + 1, "text": "문장 " * 8} for i in range(200)]},
+            indent=4,
+            ensure_ascii=False,
+        ),
+    }
+    writers = {
+        "write_text": lambda path, data: path.write_text(data, encoding="utf-8"),
+        **{
+            f"atomic/{policy}": (lambda policy: lambda path, data: atomic_write(path, data, policy))(policy)
+            for policy in FSYNC_POLICIES
+        },
+    }
+
+    try:
+        for kind, data in payloads.items():
+            print (f"==== {kind} ({len(data.encode('utf-8'))} bytes) x {args.count} ====")
+            print (f"{'level':<14}{'writes/s':>12}{'ms/write':>12}{'MB/s':>10}")
+            for name, write in writers.items():
+                folder = root / kind / name.replace("/", "_")
+                folder.mkdir(parents=True)
+                stats = bench(write, folder, data, args.count)
+                print (f"{name:<14}{stats['writes/s']:>12.0f}{stats['ms/write']:>12.3f}{stats['MB/s']:>10.2f}")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -28,4 +28,8 @@ python -m pip install --upgrade pip
 # Install requriements
 echo "Installing requirements..."
 pip install -r requirements.txt
+
+# Compile the codebook for memory-mapped loading
+echo "Compiling codebook..."
+python src/codebook.py data/emotion_codebook.tsv
 echo "Done."
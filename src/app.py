@@ -7,6 +7,9 @@
 """
 How to run
 uvicorn app:app --reload --host=0.0.0.0 --port=59931
+
+In production, run several workers sharing the codebook with serve.py
+python serve.py --workers 4 --port 8001
 """
 
 import os
@@ -6,11 +6,21 @@
 
 from pathlib import Path
 from .config import settings
+from .metrics import MetricsMiddleware, metrics_endpoint
+from .warmup import lifespan, healthz, readyz
 from fastapi import FastAPI
 
 def create_app():
-    app = FastAPI(title=settings.app_name)
+    app = FastAPI(title=settings.app_name, lifespan=lifespan)
     Path(settings.exp_folder).mkdir(parents=True, exist_ok=True)
+
+    # Probes of the load balancer
+    app.add_api_route("/healthz", healthz, methods=["GET"], include_in_schema=False)
+    app.add_api_route("/readyz", readyz, methods=["GET"], include_in_schema=False)
+
+    # Prometheus-style metrics
+    app.add_middleware(MetricsMiddleware)
+    app.add_api_route("/metrics", metrics_endpoint, methods=["GET"], include_in_schema=False)
     return app
 
 app = create_app()
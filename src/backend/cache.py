@@ -0,0 +1,30 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Copyright (c) 2024- SATURN
+# AUTHORS:
+# Sukbong Kwon (Galois)
+
+# Cache of the scoring results for repeated inputs
+
+import hashlib
+from typing import Text
+
+from .config import settings
+from utils import LRUCache
+
+response_cache = LRUCache(maxsize=settings.cache_size, ttl=settings.cache_ttl)
+
+
+def response_key(
+    sentence: Text,
+    top_k: int,
+    checksum: Text,
+)-> Text:
+    """Content hash of a scoring request
+
+    The result only depends on the words of the sentence, so whitespace is
+    normalized. The checksum of the codebook makes entries of a previous
+    codebook unreachable.
+    """
+    content = "\t".join([checksum, str(top_k), " ".join(sentence.split())])
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
@@ -27,6 +27,18 @@ class Settings(BaseModel):
     app_name: str = APP_NAME
     version: str = VERSION
     exp_folder: Path = Path("exp")
-    workers: int = 2
+    workers: int = 2            # Server processes started by serve.py
+    host: str = "0.0.0.0"
+    port: int = 8001
+    scoring_workers: int = 2    # Threads or processes scoring per server process
+    executor: str = "thread"    # "thread" or "process" for scoring
+    max_queue: int = 32         # Scoring calls waiting for a worker
+    max_batch_size: int = 1000  # Sentences per /run_batch request
+    stream_chunk_size: int = 64 # Sentences scored at once by /run_stream
+    cache_size: int = 10000     # Cached /run results, 0 disables the cache
+    cache_ttl: float = 300.0    # Seconds a cached /run result stays valid
+    warmup_size: int = 64       # Codebook words scored by the warm-up
+    server_timing: bool = False # Return the stage timings in a Server-Timing header
+    slow_request_ms: float = 0.0 # Log the stage profile of slower requests, 0 disables
 
 settings = Settings()
\ No newline at end of file
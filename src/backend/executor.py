@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Copyright (c) 2024- SATURN
+# AUTHORS:
+# Sukbong Kwon (Galois)
+
+# Run CPU-bound scoring off the event loop
+
+import os
+import time
+import signal
+import asyncio
+import threading
+from functools import partial
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Text, Dict, Any, Callable, Optional
+
+from .config import settings
+from data import Scoring
+from utils import StageTimer
+
+
+# Engines of a worker process by the checksum the parent expects.
+# A new checksum means the parent reloaded the codebook.
+worker_engines: Dict[Text, Scoring] = {}
+
+
+def call_in_worker(
+    codebook: Text,
+    kwargs: Dict[Text, Any],
+    checksum: Text,
+    method: Text,
+    *args: Any,
+    timer: Optional[StageTimer] = None,
+)-> Any:
+    """Call `method` of the worker's engine, (re)building it when needed
+
+    With a `timer`, the timer comes back with the result, `(result, timer)`.
+    """
+    scoring = worker_engines.get(checksum)
+    if scoring is None:
+        worker_engines.clear()
+        scoring = worker_engines[checksum] = Scoring(codebook=codebook, **kwargs)
+    if timer is None:
+        return getattr(scoring, method)(*args)
+    return call_timed(getattr(scoring, method), timer, *args), timer
+
+
+def call_timed(
+    fn: Callable[..., Any],
+    timer: StageTimer,
+    *args: Any,
+)-> Any:
+    """Call `fn` on a worker, the wait for the worker is the `queue` stage"""
+    timer.mark("queue")
+    return fn(*args, timer=timer)
+
+
+def init_process(
+    parent: int,
+)-> None:
+    """Leave the interrupts to the server worker and exit along with it
+
+    The worker stops its pool on shutdown, but a worker killed by a signal
+    (uvicorn skips the shutdown on a forced exit) would leave the processes
+    behind, still holding the listening socket.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    threading.Thread(target=watch_parent, args=(parent,), daemon=True).start()
+
+
+def watch_parent(
+    parent: int,
+    interval: float = 1.0,
+)-> None:
+    while os.getppid() == parent:
+        time.sleep(interval)
+    os._exit(0)
+
+
+class ScoringExecutor:
+    def __init__(
+        self,
+        workers: int = 2,
+        max_queue: int = 32,
+        mode: Text = "thread",
+    )-> None:
+        """Bounded pool of threads or processes for scoring
+
+        At most `workers + max_queue` calls are accepted at once, the rest
+        are rejected with `asyncio.QueueFull` so the caller can answer
+        `ERROR_SERVER_IS_BUSY` instead of piling up latency.
+
+        The pool is created on first use by the process using it, so an
+        executor built before a fork gives every forked server worker its
+        own pool instead of sharing the queues and pipes of the parent.
+
+        Parameters
+        ----------
+        workers : int
+            Number of threads or processes
+        max_queue : int
+            Number of calls waiting for a free worker
+        mode : Text
+            `thread` or `process`. Processes avoid the GIL, each of them
+            loads the codebook once.
+        """
+        if mode not in ("thread", "process"):
+            raise ValueError(f"Unknown executor mode '{mode}', choose from ['thread', 'process']")
+
+        self.workers = workers
+        self.max_queue = max_queue
+        self.mode = mode
+        self.pending = 0  # Only touched from the event loop
+        self._pool: Optional[Executor] = None
+        self._pid: Optional[int] = None
+
+    @property
+    def pool(
+        self,
+    )-> Executor:
+        """Pool of the current process, created after a fork"""
+        if self._pool is None or self._pid != os.getpid():
+            # A pool inherited through a fork belongs to the parent, its
+            # threads are gone here, so leave it alone and start a new one
+            self._pid = os.getpid()
+            self._pool = (
+                ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    initializer=init_process,
+                    initargs=(self._pid,),
+                ) if self.mode == "process"
+                else ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="scoring")
+            )
+        return self._pool
+
+    @property
+    def queue_depth(
+        self,
+    )-> int:
+        """Number of calls waiting for a free worker"""
+        return max(self.pending - self.workers, 0)
+
+    async def run(
+        self,
+        fn: Callable[..., Any],
+        *args: Any,
+    )-> Any:
+        """Run `fn(*args)` on the pool
+
+        Raises
+        ------
+        asyncio.QueueFull
+            If the queue is full
+        """
+        if self.pending >= self.workers + self.max_queue:
+            raise asyncio.QueueFull()
+
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.pool, fn, *args)
+        finally:
+            self.pending -= 1
+
+    async def score(
+        self,
+        engine: Any,
+        scoring: Scoring,
+        method: Text,
+        *args: Any,
+        timer: Optional[StageTimer] = None,
+    )-> Any:
+        """Run `scoring.<method>(*args)` on the pool
+
+        Parameters
+        ----------
+        engine : ScoringEngine
+            Holder of the engine, gives the codebook to the processes
+        scoring : Scoring
+            Snapshot of the engine taken by the request
+        method : Text
+            Method of `Scoring`, e.g. `__call__` or `score_many`
+        timer : Optional[StageTimer]
+            Records the stages of the method, the time to get to the worker
+            and back is the `queue` stage
+        """
+        if self.mode == "process":
+            result = await self.run(
+                partial(call_in_worker, timer=timer),
+                engine.codebook,
+                engine.kwargs,
+                scoring.checksum,
+                method,
+                *args,
+            )
+            if timer is None:
+                return result
+            # The timer was copied to the process, take its stages back
+            result, worker_timer = result
+            timer.update(worker_timer)
+
+        elif timer is None:
+            return await self.run(getattr(scoring, method), *args)
+
+        else:
+            result = await self.run(call_timed, getattr(scoring, method), timer, *args)
+
+        timer.mark("queue")
+        return result
+
+    def shutdown(
+        self,
+    )-> None:
+        if self._pool is not None and self._pid == os.getpid():
+            # Wait for the processes, a worker exits right after this and
+            # would leave them behind holding the listening socket
+            self._pool.shutdown(wait=self.mode == "process", cancel_futures=True)
+        self._pool = None
+
+
+executor = ScoringExecutor(
+    workers=settings.scoring_workers,
+    max_queue=settings.max_queue,
+    mode=settings.executor,
+)
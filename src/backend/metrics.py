@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Copyright (c) 2024- SATURN
+# AUTHORS:
+# Sukbong Kwon (Galois)
+
+# Prometheus-style metrics of the scoring service
+#
+# The middleware only bumps plain counters from the event loop thread, so
+# the hot path takes no lock. Cumulative buckets, ratios and the gauges of
+# the engine, executor and caches are put together when `/metrics` is read.
+
+import time
+import bisect
+from typing import Text, Dict, List, Tuple
+
+from fastapi.responses import PlainTextResponse
+
+# Upper bounds (seconds) of the latency histogram buckets
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Metrics:
+    def __init__(
+        self,
+    )-> None:
+        # {(route, method, status): count}
+        self.requests: Dict[Tuple[Text, Text, int], int] = {}
+        # {route: [count of each bucket, ..., count above the last bucket]}
+        self.latency: Dict[Text, List[int]] = {}
+        self.latency_sum: Dict[Text, float] = {}
+        # {name: (help, value)} set once, e.g. by the warm-up
+        self.gauges: Dict[Text, Tuple[Text, float]] = {}
+
+    def observe(
+        self,
+        route: Text,
+        method: Text,
+        status: int,
+        seconds: float,
+    )-> None:
+        key = (route, method, status)
+        self.requests[key] = self.requests.get(key, 0) + 1
+
+        buckets = self.latency.get(route)
+        if buckets is None:
+            buckets = self.latency[route] = [0] * (len(BUCKETS) + 1)
+            self.latency_sum[route] = 0.0
+        buckets[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.latency_sum[route] += seconds
+
+    def set_gauge(
+        self,
+        name: Text,
+        value: float,
+        help: Text = "",
+    )-> None:
+        self.gauges[name] = (help, value)
+
+
+metrics = Metrics()
+
+
+class MetricsMiddleware:
+    def __init__(
+        self,
+        app,
+    )-> None:
+        """ASGI middleware counting requests and their latency per route"""
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            # The router puts the matched route in the scope
+            route = getattr(scope.get("route"), "path", "unmatched")
+            metrics.observe(route, scope["method"], status, time.perf_counter() - start)
+
+
+def escape(
+    value: Text,
+)-> Text:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def render()-> Text:
+    """Metrics in the Prometheus text exposition format"""
+    from .models import engine
+    from .executor import executor
+    from .cache import response_cache
+    from .singleflight import single_flight
+
+    lines = []
+
+    def add(name: Text, kind: Text, help: Text, samples: List[Tuple[Text, float]]):
+        lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            lines.append(f"{name}{labels} {value}")
+
+    add("scoring_requests_total", "counter", "Requests by route, method and status", [
+        (f'{{route="{escape(route)}",method="{method}",status="{status}"}}', count)
+        for (route, method, status), count in sorted(metrics.requests.items())
+    ])
+
+    samples = []
+    for route, buckets in sorted(metrics.latency.items()):
+        label = escape(route)
+        total = 0
+        for bound, count in zip(BUCKETS + ("+Inf",), buckets):
+            total += count
+            samples.append((f'_bucket{{route="{label}",le="{bound}"}}', total))
+        samples.append((f'_sum{{route="{label}"}}', metrics.latency_sum[route]))
+        samples.append((f'_count{{route="{label}"}}', total))
+    lines.append("# HELP scoring_request_duration_seconds Latency of the requests by route")
+    lines.append("# TYPE scoring_request_duration_seconds histogram")
+    lines.extend(f"scoring_request_duration_seconds{suffix} {value}" for suffix, value in samples)
+
+    scoring = engine.scoring
+    responses = response_cache.info()
+    add("scoring_executor_queue_depth", "gauge", "Scoring calls waiting for a worker",
+        [("", executor.queue_depth)])
+    add("scoring_executor_in_flight", "gauge", "Scoring calls accepted by the executor",
+        [("", executor.pending)])
+    if scoring is not None:
+        lookups = scoring.cache.info()
+        add("scoring_codebook_size", "gauge", "Number of words in the codebook",
+            [("", len(scoring.data))])
+        add("scoring_codebook_version", "gauge", "Version of the codebook",
+            [("", scoring.version)])
+        add("scoring_find_best_calls_total", "counter",
+            "Calls of Scoring.find_best in this process (process executors count their own)",
+            [("", lookups["hits"] + lookups["misses"])])
+        add("scoring_find_best_searches_total", "counter", "Index searches of find_best (cache misses)",
+            [("", lookups["misses"])])
+        add("scoring_cache_hit_ratio", "gauge", "Hit ratio of the caches", [
+            ('{cache="lookup"}', ratio(lookups["hits"], lookups["misses"])),
+            ('{cache="response"}', ratio(responses["hits"], responses["misses"])),
+        ])
+        add("scoring_cache_size", "gauge", "Number of entries in the caches", [
+            ('{cache="lookup"}', lookups["size"]),
+            ('{cache="response"}', responses["size"]),
+        ])
+    add("scoring_singleflight_shared_total", "counter",
+        "Requests that shared a concurrent identical computation", [("", single_flight.shared)])
+
+    for name, (help, value) in sorted(metrics.gauges.items()):
+        add(name, "gauge", help, [("", value)])
+
+    return "\n".join(lines) + "\n"
+
+
+def ratio(
+    hits: int,
+    misses: int,
+)-> float:
+    return round(hits / (hits + misses), 6) if hits + misses else 0.0
+
+
+async def metrics_endpoint()-> PlainTextResponse:
+    return PlainTextResponse(render(), media_type="text/plain; version=0.0.4")
@@ -16,7 +16,8 @@ MODEL_INFO = {
 }
 
 # Import the language processing model
-from data import Scoring
+from .engine import ScoringEngine
 
-engine = Scoring(codebook="../data/emotion_codebook.tsv")
+# The codebook is loaded by the warm-up of the app (see `backend.warmup`)
+engine = ScoringEngine(codebook="../data/emotion_codebook.tsv", preload=False)
 
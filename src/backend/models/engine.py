@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Copyright (c) 2024- SATURN
+# AUTHORS:
+# Sukbong Kwon (Galois)
+
+import threading
+from typing import Text, Dict, Any, Optional
+
+from data import Scoring
+
+
+class ScoringEngine:
+    def __init__(
+        self,
+        codebook: Text,
+        preload: bool = True,
+        **kwargs: Dict[Text, Any],
+    )-> None:
+        """Holder of the current scoring engine with hot-reload
+
+        Requests take one snapshot of `self.scoring` and use it until they
+        finish. A reload builds the new engine aside and swaps the reference
+        in a single assignment, so in-flight requests keep the old index.
+
+        Parameters
+        ----------
+        codebook : Text
+            Codebook file for `Scoring`
+        preload : bool
+            Load the codebook now, otherwise on `load` (e.g. by the warm-up)
+        kwargs : Dict[Text, Any]
+            Parameters for `Scoring`
+        """
+        self.codebook = codebook
+        self.kwargs = kwargs
+        self.scoring: Scoring = None
+        # Launcher of the forked workers (see `serve.py`), reloads them all
+        self.supervisor: Optional[int] = None
+        self._loading = threading.Lock()
+        self._reloading = threading.Lock()
+        if preload:
+            self.load()
+
+    def __call__(
+        self,
+        sentence: Text,
+    )-> Dict:
+        return self.scoring(sentence)
+
+    @property
+    def loaded(
+        self,
+    )-> bool:
+        return self.scoring is not None
+
+    def load(
+        self,
+    )-> Scoring:
+        """Load the codebook and build the index, once"""
+        with self._loading:
+            if self.scoring is None:
+                self.scoring = Scoring(codebook=self.codebook, **self.kwargs)
+        return self.scoring
+
+    @property
+    def reloading(
+        self,
+    )-> bool:
+        return self._reloading.locked()
+
+    def reload(
+        self,
+    )-> Dict:
+        """Rebuild the engine from the codebook and swap it in
+
+        Returns
+        -------
+        Dict
+            Information of the new codebook, see `info`
+
+        Raises
+        ------
+        RuntimeError
+            If another reload is already running
+        """
+        if not self._reloading.acquire(blocking=False):
+            raise RuntimeError("The codebook is already being reloaded")
+
+        try:
+            scoring = Scoring(codebook=self.codebook, **self.kwargs)
+            if self.scoring is not None:
+                scoring.version = self.scoring.version + 1
+            self.scoring = scoring
+        finally:
+            self._reloading.release()
+
+        return self.info(scoring)
+
+    def info(
+        self,
+        scoring: Scoring = None,
+    )-> Dict:
+        """Information of the codebook of `scoring` (the current one by default)"""
+        scoring = scoring or self.scoring
+        return {
+            "codebook": scoring.codebook,
+            "version": scoring.version,
+            "checksum": scoring.checksum,
+            "size": len(scoring.data),
+        }
@@ -4,25 +4,40 @@
 # AUTHORS:
 # Sukbong Kwon (Galois)
 
+import os
+import json
+import time
 import uuid
+import signal
+import asyncio
 from pathlib import Path
-from typing import Text, Dict
+from typing import Any, Text, Dict, List, AsyncIterator
 
 from fastapi import (
     APIRouter,
     Depends,
     Body,
+    Request,
 )
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 
 from .. import config
 from ..models import engine
+from ..executor import executor
+from ..cache import response_cache, response_key
+from ..singleflight import single_flight
+from ..timing import start_timer, finish_timer
+from ..warmup import not_ready
+from saturn.utils.response import StatusResponse
 from saturn.utils.status_code import (
     MESSAGE_SUCCESS,
+    MESSAGE_PROCESS_RUNNING_IN_THE_BACKGROUND,
     ERROR_PROCESS_FAILED,
     ERROR_FILE_NOT_FOUND,
     ERROR_TASK_NOT_SUPPORTED,
     ERROR_INPUT_IS_EMPTY,
+    ERROR_SERVER_IS_BUSY,
+    ERROR_INVALID_TASK,
 )
 
 EXP_FOLDER = config.settings.exp_folder / config.SERVICE_NAME
@@ -51,32 +66,368 @@ async def overview():
 async def run(
     request: str = Body(..., media_type='text/plain'),
     id: Text = "",
+    top_k: int = 0,
 )-> JSONResponse:
     """Run the language processing application
+
+    With `top_k`, each word also gets its ranked alternatives.
+    `cache` in the response tells if the result was scored (`miss`),
+    taken from the cache (`hit`) or shared with a concurrent identical
+    request (`shared`).
     """
+    timer = start_timer()
+
     # Generate a content ID (uuid)
     if not id:  id = uuid.uuid4().hex
 
     # Check if the input is empty
     if not request:
-        return JSONResponse(ERROR_INPUT_IS_EMPTY(
+        return StatusResponse(ERROR_INPUT_IS_EMPTY(
                 content={"id": id}
-            ).__dict__)
+            ))
 
-    result = engine(request)
+    # Keep the same engine for the whole request even if it is reloaded
+    scoring = engine.scoring
+    if scoring is None:
+        return not_ready(id)
 
     try:
-        return JSONResponse(MESSAGE_SUCCESS(
+        # Repeated inputs are answered from the cache
+        key = response_key(request, top_k, scoring.checksum)
+        if timer is not None: timer.mark("parse")
+        result = response_cache.get(key)
+        if timer is not None: timer.mark("cache")
+        cache = "hit"
+        if result is None:
+            # Score on the executor, the event loop keeps serving requests.
+            # Identical requests arriving meanwhile share the same scoring.
+            result, shared = await single_flight.do(
+                key,
+                lambda: executor.score(engine, scoring, "__call__", request, top_k, timer=timer),
+            )
+            response_cache.put(key, result)
+            cache = "shared" if shared else "miss"
+            if shared and timer is not None: timer.mark("shared")
+
+        response = StatusResponse(MESSAGE_SUCCESS(
             content={
                 "id": id,
                 "result": result,
+                "codebook": {
+                    "version": scoring.version,
+                    "checksum": scoring.checksum,
+                },
+                "cache": cache,
             }
-        ).__dict__)
+        ))
+        return finish_timer(timer, response, "/scoring/run", id)
+
+    except asyncio.QueueFull:
+        return StatusResponse(ERROR_SERVER_IS_BUSY(
+            content={
+                "id": id,
+                "queue": executor.queue_depth,
+            }
+        ))
 
     except Exception as e:
-        return JSONResponse(ERROR_PROCESS_FAILED(
+        return StatusResponse(ERROR_PROCESS_FAILED(
             content={
                 'error': str(e),
             }
-        ).__dict__)
+        ))
+
+
+
+def record_sentence(
+    record: Any,
+)-> Text:
+    """Sentence of an NDJSON record, a JSON string or an object with `sentence`"""
+    sentence = record.get("sentence") if isinstance(record, dict) else record
+    if not isinstance(sentence, str):
+        raise ValueError(f"The record should be a string or an object with a "
+                         f"`sentence` string, got {json.dumps(record, ensure_ascii=False):.80}")
+    return sentence
+
 
+def parse_sentences(
+    body: bytes,
+    content_type: Text = "",
+)-> List[Text]:
+    """Parse the sentences of a batch request
+
+    The body is a JSON array of sentences, NDJSON (`application/x-ndjson`,
+    each line a JSON string or an object with `sentence`) or plain text
+    with one sentence per line. The content type decides, a body is only
+    sniffed for a JSON array when it has none: plain text lines may start
+    with `[` (e.g. `[웃음] 가엾다`).
+
+    Raises
+    ------
+    ValueError
+        If the body can't be parsed or a sentence isn't a string, the
+        message gives the index of the sentence
+    """
+    text = body.decode("utf-8")
+    if not content_type:
+        is_json = text.lstrip().startswith("[")
+    else:
+        is_json = "json" in content_type and "ndjson" not in content_type
+    if is_json:
+        sentences = json.loads(text)
+        if not isinstance(sentences, list):
+            raise ValueError("The body should be a JSON array of sentences")
+        for idx, sentence in enumerate(sentences):
+            if not isinstance(sentence, str):
+                raise ValueError(f"Sentence {idx} should be a string, "
+                                 f"got {json.dumps(sentence, ensure_ascii=False):.80}")
+        return sentences
+
+    lines = [line for line in text.splitlines() if line.strip()]
+    if "ndjson" in content_type:
+        sentences = []
+        for idx, line in enumerate(lines):
+            try:
+                sentences.append(record_sentence(json.loads(line)))
+            except ValueError as e:
+                raise ValueError(f"Sentence {idx}: {e}") from e
+        return sentences
+    return lines
+
+
+@router.post("/run_batch", operation_id="run_batch_endpoint")
+async def run_batch(
+    request: Request,
+    id: Text = "",
+    top_k: int = 0,
+)-> JSONResponse:
+    """Run the application on a batch of sentences in one pass
+
+    Words are looked up once for the whole batch (`Scoring.score_many`).
+    Results are keyed by the index of the sentence in the batch.
+    """
+    if not id:  id = uuid.uuid4().hex
+    timer = start_timer()
+    start = time.perf_counter()
+
+    try:
+        sentences = parse_sentences(
+            await request.body(),
+            request.headers.get("content-type", ""),
+        )
+    except Exception as e:
+        return StatusResponse(ERROR_INVALID_TASK(
+            content={
+                "id": id,
+                "error": f"Failed to parse the batch: {e}",
+            }
+        ))
+
+    if not sentences:
+        return StatusResponse(ERROR_INPUT_IS_EMPTY(
+                content={"id": id}
+            ))
+
+    if len(sentences) > config.settings.max_batch_size:
+        return StatusResponse(ERROR_INVALID_TASK(
+            content={
+                "id": id,
+                "error": f"Batch of {len(sentences)} sentences exceeds "
+                         f"the maximum of {config.settings.max_batch_size}",
+            }
+        ))
+
+    parsed = time.perf_counter()
+    if timer is not None: timer.mark("parse")
+    scoring = engine.scoring
+    if scoring is None:
+        return not_ready(id)
+
+    try:
+        results = await executor.score(engine, scoring, "score_many", sentences, top_k, timer=timer)
+        scored = time.perf_counter()
+
+        response = StatusResponse(MESSAGE_SUCCESS(
+            content={
+                "id": id,
+                "size": len(sentences),
+                "result": {str(idx): result for idx, result in enumerate(results)},
+                "codebook": {
+                    "version": scoring.version,
+                    "checksum": scoring.checksum,
+                },
+                "timing": {
+                    "parse": round((parsed - start) * 1000, 3),
+                    "score": round((scored - parsed) * 1000, 3),
+                    "total": round((time.perf_counter() - start) * 1000, 3),
+                },
+            }
+        ))
+        return finish_timer(timer, response, "/scoring/run_batch", id)
+
+    except asyncio.QueueFull:
+        return StatusResponse(ERROR_SERVER_IS_BUSY(
+            content={
+                "id": id,
+                "queue": executor.queue_depth,
+            }
+        ))
+
+    except Exception as e:
+        return StatusResponse(ERROR_PROCESS_FAILED(
+            content={
+                "id": id,
+                'error': str(e),
+            }
+        ))
+
+class BodyStreamingResponse(StreamingResponse):
+    """StreamingResponse for an iterator that reads the request body itself
+
+    On ASGI < 2.4 servers, `StreamingResponse` listens for the disconnect on
+    `receive` while streaming, which takes the body messages away from the
+    iterator. Reading the body already raises `ClientDisconnect`.
+    """
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+
+async def read_lines(
+    request: Request,
+)-> AsyncIterator[bytes]:
+    """Read the body line by line as it arrives"""
+    buffer = b""
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line
+    if buffer:
+        yield buffer
+
+
+@router.post("/run_stream", operation_id="run_stream_endpoint")
+async def run_stream(
+    request: Request,
+    top_k: int = 0,
+)-> StreamingResponse:
+    """Run the application on a stream of sentences, one per line
+
+    The body is read incrementally (plain text or NDJSON like `/run_batch`)
+    and every `stream_chunk_size` sentences are scored and sent back at
+    once as NDJSON lines `{"index", "result"}`, so memory does not grow
+    with the size of the input. A chunk that can't be scored gives
+    `{"index", "code", "error"}` lines instead, as does a line that can't
+    be decoded or parsed or has no sentence string, and the stream goes on.
+
+    Results are sent while the body is still being uploaded, so clients
+    with large inputs should read the response as they write the body.
+    """
+    ndjson = "ndjson" in request.headers.get("content-type", "")
+    chunk_size = config.settings.stream_chunk_size
+
+    # Keep the same engine for the whole stream even if it is reloaded
+    scoring = engine.scoring
+    if scoring is None:
+        return not_ready()
+
+    async def score(
+        start: int,
+        sentences: List[Text],
+    )-> AsyncIterator[str]:
+        try:
+            results = await executor.score(engine, scoring, "score_many", sentences, top_k)
+            lines = [{"index": start + i, "result": result} for i, result in enumerate(results)]
+        except asyncio.QueueFull:
+            error = ERROR_SERVER_IS_BUSY()
+            lines = [{"index": start + i, "code": error.code, "error": error.message}
+                     for i in range(len(sentences))]
+        except Exception as e:
+            lines = [{"index": start + i, "code": ERROR_PROCESS_FAILED.code, "error": str(e)}
+                     for i in range(len(sentences))]
+
+        for line in lines:
+            yield json.dumps(line, ensure_ascii=False) + "\n"
+
+    async def results()-> AsyncIterator[str]:
+        index = 0
+        sentences = []
+        async for line in read_lines(request):
+            try:
+                line = line.decode("utf-8")
+                if not line.strip():
+                    continue
+                if ndjson:
+                    line = record_sentence(json.loads(line))
+            except Exception as e:
+                # Results stay in order: score the sentences before the bad line
+                if sentences:
+                    async for output in score(index, sentences):
+                        yield output
+                    index += len(sentences)
+                    sentences = []
+                error = {"index": index, "code": ERROR_INVALID_TASK.code, "error": f"Failed to parse the line: {e!r}"}
+                yield json.dumps(error, ensure_ascii=False) + "\n"
+                index += 1
+                continue
+            sentences.append(line)
+
+            if len(sentences) >= chunk_size:
+                async for output in score(index, sentences):
+                    yield output
+                index += len(sentences)
+                sentences = []
+
+        if sentences:
+            async for output in score(index, sentences):
+                yield output
+
+    return BodyStreamingResponse(results(), media_type="application/x-ndjson")
+
+@router.post("/reload", operation_id="reload_endpoint")
+async def reload()-> JSONResponse:
+    """Reload the codebook and swap the engine without restarting
+
+    Under the launcher (`serve.py`) a worker only asks the launcher, which
+    reloads the codebook once and replaces the workers one by one, so all
+    of them serve the same codebook and keep sharing its memory.
+    """
+    if engine.supervisor is not None:
+        try:
+            os.kill(engine.supervisor, signal.SIGHUP)
+        except OSError as e:
+            return StatusResponse(ERROR_PROCESS_FAILED(
+                content={
+                    'error': f"Failed to signal the launcher: {e}",
+                }
+            ))
+        return StatusResponse(MESSAGE_PROCESS_RUNNING_IN_THE_BACKGROUND(
+            content={
+                "detail": "The launcher reloads the codebook and restarts the workers",
+                "supervisor": engine.supervisor,
+                **(engine.info() if engine.loaded else {}),
+            }
+        ))
+
+    if engine.reloading:
+        return StatusResponse(ERROR_SERVER_IS_BUSY(
+            content=engine.info()
+        ))
+
+    try:
+        # Build the new index in the background, requests keep being served
+        loop = asyncio.get_event_loop()
+        info = await loop.run_in_executor(None, engine.reload)
+        response_cache.clear()
+        return StatusResponse(MESSAGE_SUCCESS(
+            content=info
+        ))
+
+    except Exception as e:
+        return StatusResponse(ERROR_PROCESS_FAILED(
+            content={
+                'error': str(e),
+            }
+        ))
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Copyright (c) 2024- SATURN
+# AUTHORS:
+# Sukbong Kwon (Galois)
+
+# Share one computation between concurrent identical requests
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+
+class SingleFlight:
+    def __init__(
+        self,
+    )-> None:
+        """Coalesce concurrent calls with the same key into one computation
+
+        The first caller starts the computation as its own task and every
+        caller awaits it through `asyncio.shield`, so a caller that goes away
+        doesn't cancel the result for the others. The key is forgotten as
+        soon as the computation finishes, results are not cached here.
+        """
+        self.calls = 0
+        self.shared = 0
+        self._tasks: Dict[Hashable, asyncio.Task] = {}
+
+    @property
+    def in_flight(
+        self,
+    )-> int:
+        return len(self._tasks)
+
+    async def do(
+        self,
+        key: Hashable,
+        fn: Callable[[], Awaitable[Any]],
+    )-> Tuple[Any, bool]:
+        """Await `fn()`, or the running computation for `key` if there is one
+
+        Returns
+        -------
+        Tuple[Any, bool]
+            Result of the computation and whether it was shared
+        """
+        self.calls += 1
+        task = self._tasks.get(key)
+        shared = task is not None
+        if shared:
+            self.shared += 1
+        else:
+            task = asyncio.ensure_future(fn())
+            self._tasks[key] = task
+            task.add_done_callback(lambda _: self._tasks.pop(key, None))
+
+        return await asyncio.shield(task), shared
+
+
+single_flight = SingleFlight()
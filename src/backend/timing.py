@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Copyright (c) 2024- SATURN
+# AUTHORS:
+# Sukbong Kwon (Galois)
+
+# Stage timings of the scoring requests
+#
+# Requests are only timed when the Server-Timing header or the slow request
+# log is enabled, otherwise `start_timer` gives None and the timed code paths
+# skip their marks.
+
+from typing import Text, Optional
+
+from fastapi.responses import Response
+
+from .config import settings
+from utils import StageTimer
+
+
+def start_timer()-> Optional[StageTimer]:
+    if settings.server_timing or settings.slow_request_ms > 0:
+        return StageTimer()
+    return None
+
+
+def finish_timer(
+    timer: Optional[StageTimer],
+    response: Response,
+    route: Text,
+    id: Text = "",
+)-> Response:
+    """Close the `serialize` stage, add the header and log slow requests"""
+    if timer is None:
+        return response
+
+    timer.mark("serialize")
+    if settings.server_timing:
+        response.headers["Server-Timing"] = timer.server_timing()
+    if 0 < settings.slow_request_ms <= timer.total / 1e6:
+        print (f"==== Slow request {route} {id}: {timer.profile()} ====")
+    return response
@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Copyright (c) 2024- SATURN
+# AUTHORS:
+# Sukbong Kwon (Galois)
+
+# Warm-up of the scoring app and its health probes
+#
+# The warm-up runs in the background of the lifespan, so the server answers
+# `/healthz` while the codebook is loaded and `/readyz` only turns 200 once
+# the engine, the executor and the caches are hot.
+
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Text, List, Optional
+
+from fastapi import FastAPI
+
+from .config import settings
+from .metrics import metrics
+from saturn.utils.response import StatusResponse
+from saturn.utils.status_code import (
+    MESSAGE_SUCCESS,
+    MESSAGE_PROCESS_PENDING,
+    ERROR_PROCESS_FAILED,
+)
+
+
+class WarmupState:
+    def __init__(
+        self,
+    )-> None:
+        self.stage: Text = "starting"
+        self.ready = False
+        self.error: Optional[Text] = None
+        self.duration: Optional[float] = None
+
+
+state = WarmupState()
+
+
+def synthetic_sentences(
+    words: List[Text],
+    size: int,
+)-> List[Text]:
+    """Sentences of codebook words and their misspellings for the warm-up
+
+    Exact words hit the index directly, misspelled ones go through the
+    search and unknown ones through the whole rejection path.
+    """
+    words = words[:size]
+    variants = [word[:-1] + "가" if len(word) > 1 else word for word in words]
+    return [
+        " ".join(group)
+        for group in zip(words, variants, ["가나다라마바사"] * len(words))
+    ]
+
+
+async def warm_up()-> None:
+    """Load the engine and run a synthetic scoring pass on the executor"""
+    from .models import engine
+    from .executor import executor
+
+    start = time.perf_counter()
+    loop = asyncio.get_running_loop()
+    try:
+        print ("==== Warm-up: loading the codebook ====")
+        state.stage = "loading"
+        scoring = await loop.run_in_executor(None, engine.load)
+
+        print ("==== Warm-up: scoring ====")
+        state.stage = "scoring"
+        sentences = synthetic_sentences(scoring.index.keys, settings.warmup_size)
+        if sentences:
+            # One call per worker so every thread (or process) is started
+            # and, in process mode, has loaded its own engine
+            await asyncio.gather(*[
+                executor.score(engine, scoring, "__call__", sentences[i % len(sentences)], 1)
+                for i in range(executor.workers)
+            ])
+            await executor.score(engine, scoring, "score_many", sentences, 0)
+
+            # Encode once to import the serializers before the first request
+            StatusResponse(MESSAGE_SUCCESS(content={"result": scoring(sentences[0])}))
+
+        state.duration = time.perf_counter() - start
+        state.stage = "ready"
+        state.ready = True
+        metrics.set_gauge("scoring_warmup_seconds", state.duration, "Duration of the warm-up")
+        print (f"==== Warm-up done in {state.duration:.3f} sec ====")
+
+    except Exception as e:
+        state.duration = time.perf_counter() - start
+        state.stage = "failed"
+        state.error = str(e)
+        print (f"==== Warm-up failed after {state.duration:.3f} sec: {e} ====")
+
+    finally:
+        metrics.set_gauge("scoring_ready", int(state.ready), "1 once the warm-up is done")
+
+
+@asynccontextmanager
+async def lifespan(
+    app: FastAPI,
+):
+    """Warm up in the background, shut the executor down on exit"""
+    from .executor import executor
+
+    metrics.set_gauge("scoring_ready", 0, "1 once the warm-up is done")
+    task = asyncio.create_task(warm_up())
+    try:
+        yield
+    finally:
+        task.cancel()
+        executor.shutdown()
+
+
+async def healthz()-> StatusResponse:
+    """Liveness, the event loop is serving requests"""
+    return StatusResponse(MESSAGE_SUCCESS(content={"status": "alive"}))
+
+
+def not_ready(
+    id: Text = "",
+)-> StatusResponse:
+    """503 for a scoring request arriving before the engine is loaded"""
+    content = {"id": id, "ready": False, "stage": state.stage}
+    if state.error is not None:
+        return StatusResponse(ERROR_PROCESS_FAILED(content={**content, "error": state.error}), status_code=503)
+    return StatusResponse(MESSAGE_PROCESS_PENDING(content=content), status_code=503)
+
+
+async def readyz()-> StatusResponse:
+    """Readiness, 503 until the warm-up is done"""
+    content = {
+        "ready": state.ready,
+        "stage": state.stage,
+        "warmup": state.duration,
+    }
+    if state.ready:
+        return StatusResponse(MESSAGE_SUCCESS(content=content))
+    if state.error is not None:
+        return StatusResponse(
+            ERROR_PROCESS_FAILED(content={**content, "error": state.error}),
+            status_code=503,
+        )
+    return StatusResponse(MESSAGE_PROCESS_PENDING(content=content), status_code=503)
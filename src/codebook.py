@@ -0,0 +1,354 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Copyright (c) 2022-2024 SATURN
+# AUTHORS:
+# Sukbong Kwon (Galois)
+
+"""
+Compile the TSV codebook into a binary artifact for memory-mapped loading
+
+How to run
+python codebook.py ../data/emotion_codebook.tsv -o ../data/emotion_codebook.bin
+
+Layout of the artifact (little endian)
+```
+header   MAGIC, format version (u4), number of keys N (u4), blob size (u8)
+scores   f8[N]    score of each key in sorted order
+order    u4[N]    sorted position of each key in codebook order
+offsets  u4[N+1]  byte offsets of the sorted keys in the blob
+blob     UTF-8 encoded keys in sorted order
+```
+"""
+
+import os
+import mmap
+import uuid
+import struct
+import numpy as np
+from pathlib import Path
+from collections.abc import MutableMapping
+from typing import Text, Dict, Set, Union, Optional, Iterator, Tuple
+
+MAGIC = b"SCBK"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<4sIIQ")
+SPAN = struct.Struct("<II")
+SUFFIX = ".bin"
+
+
+def read_tsv(
+    path: Union[Text, Path],
+)-> Dict[Text, float]:
+    """Read the TSV codebook (`word` and `score` columns) in codebook order"""
+    import pandas as pd
+
+    df = pd.read_csv(path, sep='\t')
+    return df.set_index("word")["score"].to_dict()
+
+
+def compile_codebook(
+    tsv_path: Union[Text, Path],
+    out_path: Optional[Union[Text, Path]] = None,
+)-> Path:
+    """Compile the TSV codebook into the binary artifact
+
+    Parameters
+    ----------
+    tsv_path : Union[Text, Path]
+        TSV codebook
+    out_path : Optional[Union[Text, Path]]
+        Binary artifact, by default next to the TSV with the `.bin` suffix
+
+    Returns
+    -------
+    Path
+        Path of the binary artifact
+    """
+    out_path = Path(out_path) if out_path else Path(tsv_path).with_suffix(SUFFIX)
+    data = read_tsv(tsv_path)
+
+    keys = list(data.keys())
+    ranks = sorted(range(len(keys)), key=lambda idx: keys[idx])
+    order = np.empty(len(keys), dtype="<u4")
+    order[ranks] = np.arange(len(keys), dtype="<u4")
+
+    encoded = [keys[idx].encode("utf-8") for idx in ranks]
+    offsets = np.zeros(len(keys) + 1, dtype="<u4")
+    offsets[1:] = np.cumsum([len(key) for key in encoded])
+    blob = b"".join(encoded)
+    scores = np.array([data[keys[idx]] for idx in ranks], dtype="<f8")
+
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    # Running engines map the artifact, rewriting it in place would change
+    # their scores or cut the mapping short (SIGBUS), so the new artifact
+    # is renamed over the old one, whose pages stay with its mappings
+    temp = out_path.with_name(f".{out_path.name}.{uuid.uuid4().hex[:8]}.tmp")
+    try:
+        with temp.open("xb") as f:
+            f.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(keys), len(blob)))
+            f.write(scores.tobytes())
+            f.write(order.tobytes())
+            f.write(offsets.tobytes())
+            f.write(blob)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp, out_path)
+    except BaseException:
+        temp.unlink(missing_ok=True)
+        raise
+
+    return out_path
+
+
+def is_compiled(
+    path: Union[Text, Path],
+)-> bool:
+    """Check the magic number of the file"""
+    try:
+        with open(path, "rb") as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+
+class CompiledCodebook:
+    def __init__(
+        self,
+        path: Union[Text, Path],
+    )-> None:
+        """Memory-mapped view of the binary codebook artifact
+
+        Scores, order, offsets and keys are all read from the mapped file,
+        keys are only decoded when they are returned. Every process mapping
+        the same artifact shares its pages, the object is pickled as its
+        path and mapped again.
+
+        Parameters
+        ----------
+        path : Union[Text, Path]
+            Binary artifact made by `compile_codebook`
+        """
+        self.path = Path(path)
+        with self.path.open("rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, count, blob_size = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"{self.path} is not a compiled codebook (version {FORMAT_VERSION})")
+
+        offset = HEADER.size
+        self.scores = np.frombuffer(self._mmap, dtype="<f8", count=count, offset=offset)
+        offset += self.scores.nbytes
+        self.order = np.frombuffer(self._mmap, dtype="<u4", count=count, offset=offset)
+        offset += self.order.nbytes
+        self.offsets = np.frombuffer(self._mmap, dtype="<u4", count=count + 1, offset=offset)
+        self._offsets = offset
+        offset += self.offsets.nbytes
+        self._blob = offset
+        self._count = count
+
+    def __reduce__(self):
+        return CompiledCodebook, (self.path,)
+
+    def __len__(self):
+        return self._count
+
+    def _key_bytes(
+        self,
+        idx: int,
+    )-> bytes:
+        start, end = SPAN.unpack_from(self._mmap, self._offsets + 4 * idx)
+        return self._mmap[self._blob + start:self._blob + end]
+
+    def key(
+        self,
+        idx: int,
+    )-> Text:
+        """Key at `idx` in sorted order"""
+        return self._key_bytes(idx).decode("utf-8")
+
+    def find(
+        self,
+        word: Text,
+    )-> Optional[int]:
+        """Sorted position of `word` by binary search over the mapped keys
+
+        UTF-8 bytes sort like the code points of the keys.
+        """
+        target = word.encode("utf-8")
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key_bytes(mid) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self._count and self._key_bytes(lo) == target:
+            return lo
+        return None
+
+    def get(
+        self,
+        word: Text,
+        default: Optional[float] = None,
+    )-> Optional[float]:
+        """Score of `word`"""
+        idx = self.find(word)
+        if idx is None:
+            return default
+        return float(self.scores[idx])
+
+    def items(
+        self,
+    )-> Iterator[Tuple[Text, float]]:
+        """Keys and scores in the original codebook order"""
+        for idx in self.order.tolist():
+            yield self.key(idx), float(self.scores[idx])
+
+
+class CodebookView(MutableMapping):
+    def __init__(
+        self,
+        compiled: CompiledCodebook,
+    )-> None:
+        """Codebook backed by a compiled artifact, usable as `Scoring.data`
+
+        Reads go to the mapping, so the scores are shared by the processes
+        instead of copied into a dictionary in each one. Changes
+        (`Scoring.set_entry`, `remove_entry`) are kept in small overlays
+        in front of it. Iteration is in codebook order like a dictionary:
+        changed scores keep their place and new words come last.
+        """
+        self.compiled = compiled
+        self._updated: Dict[Text, float] = {}
+        self._added: Dict[Text, float] = {}
+        self._removed: Set[Text] = set()
+
+    def _in_compiled(
+        self,
+        word: Text,
+    )-> bool:
+        return word not in self._removed and self.compiled.find(word) is not None
+
+    def __getitem__(
+        self,
+        word: Text,
+    )-> float:
+        if word in self._added:
+            return self._added[word]
+        if word in self._updated:
+            return self._updated[word]
+        if word not in self._removed:
+            score = self.compiled.get(word)
+            if score is not None:
+                return score
+        raise KeyError(word)
+
+    def __setitem__(
+        self,
+        word: Text,
+        score: float,
+    )-> None:
+        if word not in self._added and self._in_compiled(word):
+            self._updated[word] = score
+        else:
+            self._added[word] = score
+
+    def __delitem__(
+        self,
+        word: Text,
+    )-> None:
+        if word in self._added:
+            del self._added[word]
+        elif self._in_compiled(word):
+            self._updated.pop(word, None)
+            self._removed.add(word)
+        else:
+            raise KeyError(word)
+
+    def __iter__(
+        self,
+    )-> Iterator[Text]:
+        for word, _ in self.items():
+            yield word
+
+    def __len__(
+        self,
+    )-> int:
+        return len(self.compiled) - len(self._removed) + len(self._added)
+
+    def items(
+        self,
+    )-> Iterator[Tuple[Text, float]]:
+        """Words and scores in codebook order, read in one pass"""
+        for word, score in self.compiled.items():
+            if word in self._removed:
+                continue
+            yield word, self._updated.get(word, score)
+        yield from self._added.items()
+
+    def values(
+        self,
+    )-> Iterator[float]:
+        for _, score in self.items():
+            yield score
+
+
+def read_codebook(
+    path: Union[Text, Path],
+)-> MutableMapping:
+    """Read the codebook in codebook order
+
+    A compiled artifact is memory-mapped and stays the backing store of
+    the returned `CodebookView`. For a TSV, the compiled artifact next to
+    it (`.bin`) is used when it is at least as new as the TSV, and the
+    TSV itself is read into a dictionary otherwise.
+
+    Parameters
+    ----------
+    path : Union[Text, Path]
+        TSV codebook or compiled artifact
+
+    Returns
+    -------
+    MutableMapping
+        Score of each word in codebook order
+    """
+    path = Path(path)
+    compiled = path.with_suffix(SUFFIX)
+    if not is_compiled(path) and is_compiled(compiled) \
+            and compiled.stat().st_mtime >= path.stat().st_mtime:
+        path = compiled
+
+    if is_compiled(path):
+        return CodebookView(CompiledCodebook(path))
+
+    return read_tsv(path)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Compile the TSV codebook into a binary artifact')
+
+    parser.add_argument(
+        'codebook',
+        type=str,
+        help='TSV codebook with word and score columns',
+    )
+
+    parser.add_argument(
+        '-o',
+        '--output',
+        type=str,
+        default='',
+        help='Binary artifact (default: codebook with the .bin suffix)',
+    )
+    args = parser.parse_args()
+
+    out_path = compile_codebook(args.codebook, args.output or None)
+    print (f"==== Codebook compiled: {out_path} ({len(CompiledCodebook(out_path))} words) ====")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Copyright (c) 2022-2024 SATURN
+# AUTHORS:
+# Sukbong Kwon (Galois)
+
+"""
+Scoring a large corpus of sentences with a pool of processes
+
+How to run
+python corpus.py corpus.txt -o result.jsonl -w 8 --chunk-size 512
+"""
+
+import os
+import json
+import time
+import multiprocessing as mp
+from collections import deque
+from pathlib import Path
+from typing import Text, Dict, List, Iterator, Tuple, Any
+from data import Scoring
+
+
+# Scoring engine of the worker process, built once by `init_worker`
+engine = None
+
+
+def init_worker(
+    kwargs: Dict[Text, Any],
+)-> None:
+    global engine
+    engine = Scoring(**kwargs)
+
+
+def score_chunk(
+    chunk: List[Text],
+)-> List[Dict]:
+    return engine.score_many(chunk)
+
+
+def read_sentences(
+    path: Path,
+    field: Text = "sentence",
+)-> Iterator[Text]:
+    """Stream sentences from a text file (one per line) or a JSONL file
+
+    Parameters
+    ----------
+    path : Path
+        Input file, `*.jsonl` is read as JSON lines
+    field : Text
+        Field of the sentence in each JSON line
+    """
+    jsonl = path.suffix == ".jsonl"
+    with path.open(encoding="utf-8") as f:
+        for line in f:
+            line = line.rstrip("\n")
+            if jsonl:
+                if not line.strip():
+                    continue
+                yield json.loads(line)[field]
+            else:
+                yield line
+
+
+def read_chunks(
+    sentences: Iterator[Text],
+    chunk_size: int,
+)-> Iterator[List[Text]]:
+    chunk = []
+    for sentence in sentences:
+        chunk.append(sentence)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def score_corpus(
+    input_path: Path,
+    output_path: Path,
+    workers: int,
+    chunk_size: int = 256,
+    field: Text = "sentence",
+    **kwargs: Dict[Text, Any],
+)-> Tuple[int, float]:
+    """Score the corpus with a pool of processes and write ordered JSONL
+
+    Each worker builds the codebook index once. Chunks are submitted in
+    order with at most `2 * workers` of them in flight, so memory stays
+    bounded for any size of corpus.
+
+    Parameters
+    ----------
+    input_path : Path
+        Corpus file, one sentence per line or JSONL
+    output_path : Path
+        Output JSONL file, one `{"index", "sentence", "result"}` per line
+    workers : int
+        Number of worker processes
+    chunk_size : int
+        Number of sentences sent to a worker at once
+    field : Text
+        Field of the sentence in JSONL input
+    kwargs : Dict[Text, Any]
+        Parameters for `Scoring`
+
+    Returns
+    -------
+    Tuple[int, float]
+        Number of sentences and elapsed seconds
+    """
+    start = time.perf_counter()
+    count = 0
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with mp.Pool(workers, initializer=init_worker, initargs=(kwargs,)) as pool, \
+            output_path.open("w", encoding="utf-8") as out:
+
+        def write(chunk: List[Text], results: List[Dict]):
+            nonlocal count
+            for sentence, result in zip(chunk, results):
+                out.write(json.dumps(
+                    {"index": count, "sentence": sentence, "result": result},
+                    ensure_ascii=False,
+                ) + "\n")
+                count += 1
+
+        pending = deque()
+        for chunk in read_chunks(read_sentences(input_path, field), chunk_size):
+            pending.append((chunk, pool.apply_async(score_chunk, (chunk,))))
+            if len(pending) >= 2 * workers:
+                chunk, result = pending.popleft()
+                write(chunk, result.get())
+
+        while pending:
+            chunk, result = pending.popleft()
+            write(chunk, result.get())
+
+    return count, time.perf_counter() - start
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Scoring a corpus of sentences in parallel')
+
+    parser.add_argument(
+        'input',
+        type=str,
+        help='Corpus file, one sentence per line or JSONL (*.jsonl)',
+    )
+
+    parser.add_argument(
+        '-o',
+        '--output',
+        type=str,
+        required=True,
+        help='Output JSONL file',
+    )
+
+    parser.add_argument(
+        '-c',
+        '--codebook',
+        type=str,
+        default='data/emotion_codebook.tsv',
+        help='Codebook file for scoring',
+    )
+
+    parser.add_argument(
+        '-w',
+        '--workers',
+        type=int,
+        default=os.cpu_count(),
+        help='Number of worker processes',
+    )
+
+    parser.add_argument(
+        '--chunk-size',
+        type=int,
+        default=256,
+        help='Number of sentences sent to a worker at once',
+    )
+
+    parser.add_argument(
+        '--field',
+        type=str,
+        default='sentence',
+        help='Field of the sentence in JSONL input',
+    )
+
+    parser.add_argument(
+        '-i',
+        '--index',
+        type=str,
+        default='length',
+        choices=['length', 'bktree'],
+        help='Search index over the codebook',
+    )
+
+    parser.add_argument(
+        '-j',
+        '--jamo',
+        action='store_true',
+        help='Match on jamo-decomposed words',
+    )
+    args = parser.parse_args()
+
+    count, elapsed = score_corpus(
+        Path(args.input),
+        Path(args.output),
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+        field=args.field,
+        codebook=args.codebook,
+        index_type=args.index,
+        jamo=args.jamo,
+    )
+    print (f"==== Scored {count} sentences in {elapsed:.2f}s "
+           f"({count / max(elapsed, 1e-9):.1f} sentences/s) ====")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,43 +6,181 @@
 
 
 import json
-import pandas as pd
-import editdistance as ed
+import hashlib
 import numpy as np
 from pathlib import Path
-from typing import Text, Dict, Tuple
+from typing import Text, Dict, Tuple, Any, List, Iterable, Optional
 from pydantic import BaseModel
+from index import build_index, JAMO_THRESHOLD
+from codebook import read_codebook
+from utils import LRUCache, ScoreStatistics, StageTimer
+
+# Entry hashes are summed modulo 2**64 into the codebook checksum
+DIGEST_MODULUS = 1 << 64
+
+
+def entry_hash(
+    word: Text,
+    score: float,
+)-> int:
+    """Hash of a codebook entry, the checksum is the sum over the entries"""
+    entry = f"{word}\t{float(score)!r}".encode("utf-8")
+    return int.from_bytes(hashlib.blake2b(entry, digest_size=8).digest(), "little")
 
 
 class ScoringConfig(BaseModel):
-    data: Dict = {}
+    data: Any = {}
     threshold: float = 0.4
+    index_type: Text = "length"
+    jamo: bool = False
+    index: Any = None
+    codebook: Text = ""
+    checksum: Text = ""
+    digest: int = 0
+    version: int = 0
+    cache: Any = None
+    statistics: Any = None
 
 
 class Scoring(ScoringConfig):
     def __init__(
         self,
         codebook: Text,
+        index_type: Text = "length",
+        jamo: bool = False,
+        cache_size: int = 4096,
+        threshold: Optional[float] = None,
     )-> None:
         """Scoring the sentence with target words in the sentence
 
+        Parameters
+        ----------
+        codebook : Text
+            Codebook file (TSV with `word` and `score` columns)
+            or its compiled artifact (see `codebook.py`)
+        index_type : Text
+            Search index over the codebook, `length` or `bktree`
+        jamo : bool
+            Match on jamo-decomposed words instead of syllable blocks
+        cache_size : int
+            Maximum number of words in the `find_best` cache, 0 disables it
+        threshold : Optional[float]
+            Maximum normalized edit distance of a match, by default 0.4 on
+            syllables and `JAMO_THRESHOLD` on jamo, whose distances are on
+            another scale
         """
-        super().__init__()
+        super().__init__(index_type=index_type, jamo=jamo)
+        if threshold is not None:
+            self.threshold = threshold
+        elif jamo:
+            self.threshold = JAMO_THRESHOLD
+
+        self.cache = LRUCache(maxsize=cache_size)
+        self.load_codebook(codebook)
 
+    def load_codebook(
+        self,
+        codebook: Text,
+    )-> None:
+        """(Re)load the codebook and build its search index
+
+        Parameters
+        ----------
+        codebook : Text
+            Codebook file (TSV with `word` and `score` columns)
+            or its compiled artifact (see `codebook.py`)
+        """
         # Load codebook
-        df = pd.read_csv(codebook, sep='\t')
-        self.data = df.set_index("word")["score"].to_dict()
+        self.data = read_codebook(codebook)
+        self.codebook = str(codebook)
         print ("==== Codebook loaded ====")
 
+        # Statistics of the score array, kept up to date from now on
+        self.statistics = ScoreStatistics(self.get_scores)
+
+        # Build the search index over the codebook keys
+        self.index = build_index(list(self.data.keys()), self.index_type, self.jamo)
+        self.digest = sum(entry_hash(word, score) for word, score in self.data.items()) % DIGEST_MODULUS
+        self._changed()
+
+    def set_entry(
+        self,
+        word: Text,
+        score: float,
+    )-> None:
+        """Add a word to the codebook or change its score
+
+        Parameters
+        ----------
+        word : Text
+        score : float
+        """
+        old = self.data.get(word)
+        self.data[word] = score
+        if old is None:
+            self.statistics.add(score)
+            self.index.insert(word)
+        else:
+            self.statistics.update(old, score)
+            self.digest -= entry_hash(word, old)
+        self.digest = (self.digest + entry_hash(word, score)) % DIGEST_MODULUS
+        self._changed()
+
+    def remove_entry(
+        self,
+        word: Text,
+    )-> None:
+        """Remove a word from the codebook
+
+        Parameters
+        ----------
+        word : Text
+        """
+        score = self.data.pop(word)
+        self.statistics.remove(score)
+        self.digest = (self.digest - entry_hash(word, score)) % DIGEST_MODULUS
+        self.index.remove(word)
+        if len(self.index.removed) > len(self.data):
+            # Mostly removed keys, compact the index
+            self.index = build_index(list(self.data.keys()), self.index_type, self.jamo)
+        self._changed()
+
+    def get_scores(
+        self,
+    )-> np.ndarray:
+        """Scores of the codebook as a NumPy array (codebook order)"""
+        return np.fromiter(self.data.values(), dtype=np.float64, count=len(self.data))
+
+    def _changed(
+        self,
+    )-> None:
+        """Bump the codebook version after the entries changed
+
+        The checksum comes from `digest`, the sum of the entry hashes kept
+        up to date by the edits, so it identifies the entries without
+        hashing the whole codebook again.
+        """
+        self.checksum = f"{self.digest:016x}"[:12]
+
+        # Cached lookups belong to the previous codebook
+        self.version += 1
+        self.cache.clear()
+
     def __call__(
         self,
         sentence: Text,
+        top_k: int = 0,
+        timer: Optional[StageTimer] = None,
     )-> Dict:
         """Scoring the sentence with target words in the sentence
 
         Parameters
         ----------
         sentence : Text
+        top_k : int
+            Number of ranked alternatives to add to each word, 0 for none
+        timer : Optional[StageTimer]
+            Records the tokenize, lookup and aggregate stages
 
         Returns
         -------
@@ -50,28 +188,130 @@ class Scoring(ScoringConfig):
             Score of the sentence
         """
         words = sentence.split()
-        matched_words = []
-        mathced_distance = []
-        mathced_scores = []
-        for word in sentence.split():
-            best, distance, score = self.find_best(word)
-            matched_words.append(best)
-            mathced_distance.append(distance)
-            mathced_scores.append(score)
-
-        # Cancatenate the matched words and scores
-        result = {}
-        for word, best, distance, score in zip(words, matched_words, mathced_distance, mathced_scores):
-            result[word] = {"best_word": best, "distance": str(distance), "score": str(score)}
+        if timer is not None: timer.mark("tokenize")
+        matches = [self.find_best(word) for word in words]
+        if timer is not None: timer.mark("lookup")
 
         # Compute the final score
         final_score = 0.0
-        for distance, score in zip(mathced_distance, mathced_scores):
+        for _, distance, score in matches:
             final_score += distance * score
+
+        result = self.make_result(words, matches, final_score)
+        if timer is not None: timer.mark("aggregate")
+        if top_k > 0:
+            self.add_alternatives(result, words, top_k)
+            if timer is not None: timer.mark("lookup")
+
+        return result
+
+    def score_many(
+        self,
+        sentences: Iterable[Text],
+        top_k: int = 0,
+        timer: Optional[StageTimer] = None,
+    )-> List[Dict]:
+        """Scoring a batch of sentences at once
+
+        Every distinct word of the batch is looked up only once and the final
+        scores are accumulated with NumPy. The results are identical to
+        `[self(sentence) for sentence in sentences]`.
+
+        Parameters
+        ----------
+        sentences : Iterable[Text]
+        top_k : int
+            Number of ranked alternatives to add to each word, 0 for none
+        timer : Optional[StageTimer]
+            Records the tokenize, lookup and aggregate stages
+
+        Returns
+        -------
+        List[Dict]
+            Result of each sentence in the input order
+        """
+        tokenized = [sentence.split() for sentence in sentences]
+
+        # Deduplicate the vocabulary of the batch
+        vocabulary: Dict[Text, int] = {}
+        for words in tokenized:
+            for word in words:
+                vocabulary.setdefault(word, len(vocabulary))
+        if timer is not None: timer.mark("tokenize")
+        matches = [self.find_best(word) for word in vocabulary]
+        if timer is not None: timer.mark("lookup")
+
+        # Ragged layout: vocabulary positions of all the words of the batch
+        # one after the other and the offset of each sentence, so memory
+        # grows with the number of words, not batch size x longest sentence
+        products = np.array([distance * score for _, distance, score in matches], dtype=np.float64)
+        offsets = np.zeros(len(tokenized) + 1, dtype=np.int64)
+        np.cumsum([len(words) for words in tokenized], out=offsets[1:])
+        positions = np.fromiter(
+            (vocabulary[word] for words in tokenized for word in words),
+            dtype=np.int64,
+            count=int(offsets[-1]),
+        )
+        terms = products[positions]
+
+        # Sum each sentence left to right like __call__: cumsum adds in order
+        # (np.add.reduceat sums pairwise), + 0.0 turns a leading -0.0 into 0.0
+        # like the 0.0 that __call__ starts from
+        buffer = np.empty(int(np.diff(offsets).max(initial=0)))
+        final_scores = [
+            float(np.cumsum(terms[start:end], out=buffer[:end - start])[-1]) + 0.0 if end > start else 0.0
+            for start, end in zip(offsets[:-1].tolist(), offsets[1:].tolist())
+        ]
+
+        results = [
+            self.make_result(
+                words,
+                [matches[vocabulary[word]] for word in words],
+                float(final_score),
+            )
+            for words, final_score in zip(tokenized, final_scores)
+        ]
+        if timer is not None: timer.mark("aggregate")
+
+        if top_k > 0:
+            alternatives = {word: self.find_top_k(word, top_k) for word in vocabulary}
+            for words, result in zip(tokenized, results):
+                self.add_alternatives(result, words, top_k, alternatives)
+            if timer is not None: timer.mark("lookup")
+
+        return results
+
+    @staticmethod
+    def make_result(
+        words: List[Text],
+        matches: List[Tuple[Text, float, float]],
+        final_score: float,
+    )-> Dict:
+        """Cancatenate the matched words and scores with the final score"""
+        result = {}
+        for word, (best, distance, score) in zip(words, matches):
+            result[word] = {"best_word": best, "distance": str(distance), "score": str(score)}
         result["final_score"] = round(final_score,2)
 
         return result
 
+    def add_alternatives(
+        self,
+        result: Dict,
+        words: List[Text],
+        top_k: int,
+        alternatives: Dict[Text, List[Tuple[Text, float, float]]] = None,
+    )-> None:
+        """Add the ranked `top_k` codebook matches to each word of `result`"""
+        for word in words:
+            if word == "final_score":
+                continue
+            matches = alternatives[word] if alternatives else self.find_top_k(word, top_k)
+            result[word]["alternatives"] = [
+                {"word": best, "distance": str(distance), "score": str(score)}
+                for best, distance, score in matches
+            ]
+
     def find_best(
         self,
         word: Text,
@@ -87,42 +327,79 @@ class Scoring(ScoringConfig):
         Text
             Best word
         """
-        best_word = ""
-        best_distance = 1
-        best_score = 0.0
+        key = (word, self.threshold, self.version)
+        best = self.cache.get(key)
+        if best is None:
+            best = self._find_best(word)
+            self.cache.put(key, best)
 
+        return best
+
+    def _find_best(
+        self,
+        word: Text,
+    )-> Tuple[Text, float, float]:
+        """Find the best word from the search index (uncached)"""
         # best_distance is 0 in editdistance
-        for key, value in self.data.items():
-            distance = ed.eval(word, key) / len(key)
-            if distance < best_distance:
-                best_word = key
-                best_distance = distance
-                best_score = value
-
-        if best_distance > self.threshold:
+        match = self.index.nearest(word, self.threshold)
+        if match is None:
             return "", 0.0, 0.0
 
-        return best_word, (1.0 - best_distance), best_score
+        idx, best_distance = match
+        best_word = self.index.keys[idx]
+
+        return best_word, (1.0 - best_distance), self.data[best_word]
+
+    def find_top_k(
+        self,
+        word: Text,
+        k: int,
+    )-> List[Tuple[Text, float, float]]:
+        """Find the k best words from the codebook
+
+        Parameters
+        ----------
+        word : Text
+        k : int
+            Maximum number of words
+
+        Returns
+        -------
+        List[Tuple[Text, float, float]]
+            Words with their distance and score like `find_best`, best first.
+            Only words within the threshold are returned.
+        """
+        return [
+            (self.index.keys[idx], (1.0 - distance), self.data[self.index.keys[idx]])
+            for idx, distance in self.index.nearest_k(word, k, self.threshold)
+        ]
+
+    def cache_info(
+        self,
+    )-> Dict:
+        """Hit/miss/eviction counters of the `find_best` cache
+
+        Returns
+        -------
+        Dict
+            Counters and size of the cache with the codebook version
+        """
+        return {**self.cache.info(), "version": self.version}
 
     def get_statistics(
         self,
     )-> Dict:
         """Get the statistics of the codebook
 
+        Computed once at load and kept up to date by `set_entry` and
+        `remove_entry`, see `ScoreStatistics`.
+
         Returns
         -------
         Dict
             Statistics of the codebook
         """
-        mean = sum(self.data.values()) / len(self.data.values())
-        statistics = {
-            "mean": np.mean(list(self.data.values())),
-            "std": np.std(list(self.data.values())),
-            "min": np.min(list(self.data.values())),
-            "max": np.max(list(self.data.values())),
-        }
-
-        return statistics
+        return self.statistics.summary()
 
 
 def main():
@@ -148,18 +425,54 @@ def main():
         '-th',
         '--threshold',
         type=float,
-        default=0.4,
-        help='Threshold for scoring',
+        default=None,
+        help=f'Threshold for scoring (default 0.4, {JAMO_THRESHOLD} with --jamo)',
+    )
+
+    parser.add_argument(
+        '-i',
+        '--index',
+        type=str,
+        default='length',
+        choices=['length', 'bktree'],
+        help='Search index over the codebook',
+    )
+
+    parser.add_argument(
+        '--cache-size',
+        type=int,
+        default=4096,
+        help='Maximum number of cached word lookups (0 disables the cache)',
+    )
+
+    parser.add_argument(
+        '-k',
+        '--top-k',
+        type=int,
+        default=0,
+        help='Number of ranked alternatives for each word',
+    )
+
+    parser.add_argument(
+        '-j',
+        '--jamo',
+        action='store_true',
+        help='Match on jamo-decomposed words',
     )
     args = parser.parse_args()
 
 
     app = Scoring(
         codebook=args.codebook,
+        index_type=args.index,
+        jamo=args.jamo,
+        cache_size=args.cache_size,
+        threshold=args.threshold,
     )
 
     result = app(
         sentence=args.sentence,
+        top_k=args.top_k,
     )
     print(result)
 
@@ -0,0 +1,458 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Copyright (c) 2022-2024 SATURN
+# AUTHORS:
+# Sukbong Kwon (Galois)
+
+# Search indexes over the codebook keys for `Scoring.find_best`.
+#
+# Every index answers the same query as the original linear scan:
+# the key (or the k keys) with the smallest normalized edit distance
+# `ed.eval(word, key) / len(key)`, accepted only when the distance is
+# below 1.0 and not above the threshold. Ties are broken on the key
+# that comes first in the codebook.
+#
+# Keys are inserted at the end, like new words of the codebook, and removed
+# keys stay in place as tombstones left out of the results, so the indexes
+# keep the codebook order without being rebuilt on every edit.
+
+import math
+import heapq
+import unicodedata
+import editdistance as ed
+from collections import Counter
+from functools import lru_cache
+from typing import Text, List, Dict, Set, Optional, Tuple, Callable
+
+
+@lru_cache(maxsize=65536)
+def decompose_jamo(
+    text: Text,
+)-> Text:
+    """Decompose Hangul syllables into conjoining jamo (NFD)
+
+    Examples
+    --------
+    >>> len(decompose_jamo("가엾다"))
+    7
+    """
+    return unicodedata.normalize("NFD", text)
+
+
+def identity(
+    text: Text,
+)-> Text:
+    return text
+
+
+class TopK:
+    def __init__(
+        self,
+        k: int,
+        threshold: float,
+    )-> None:
+        """Bounded heap of the k nearest keys, ranked like the linear scan
+
+        Keys are ranked by (normalized distance, codebook order) and only
+        accepted below 1.0 and within the threshold (inclusive). `bound` is
+        the largest distance that can still enter the heap, the threshold
+        until the heap is full and the worst kept distance afterwards.
+        """
+        self.k = k
+        self.threshold = threshold
+        self.bound = threshold
+        self._heap: List[Tuple[float, int]] = []
+
+    def push(
+        self,
+        distance: float,
+        idx: int,
+    )-> bool:
+        """Offer a key to the heap, returns True if it was kept"""
+        if distance >= 1.0 or distance > self.bound:
+            return False
+
+        # Max-heap on (distance, idx) through negated entries
+        entry = (-distance, -idx)
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, entry)
+        elif entry > self._heap[0]:
+            heapq.heapreplace(self._heap, entry)
+        else:
+            return False
+
+        if len(self._heap) == self.k:
+            self.bound = -self._heap[0][0]
+        return True
+
+    def results(
+        self,
+    )-> List[Tuple[int, float]]:
+        """Kept keys as (index, distance), nearest first"""
+        return [(-idx, -distance) for distance, idx in sorted(self._heap, reverse=True)]
+
+
+class BKTree:
+    def __init__(
+        self,
+        keys: List[Text],
+        transform: Callable[[Text], Text] = identity,
+    )-> None:
+        """Metric tree (Burkhard-Keller tree) over the codebook keys
+
+        Parameters
+        ----------
+        keys : List[Text]
+            Codebook keys in their original (codebook) order.
+        transform : Callable[[Text], Text]
+            Form of the keys and words that distances are computed on,
+            e.g. `decompose_jamo`. The forms of the keys are precomputed.
+        """
+        self.keys = list(keys)
+        self.transform = transform
+        self.forms = [transform(key) for key in self.keys]
+        self.max_length = max((len(form) for form in self.forms), default=0)
+        self.positions = {key: idx for idx, key in enumerate(self.keys)}
+        self.removed: Set[int] = set()
+
+        # Node: [index of the key, {edit distance: child node}]
+        self.root = None
+        for idx in range(len(self.keys)):
+            self.add(idx)
+
+    def insert(
+        self,
+        key: Text,
+    )-> int:
+        """Append a new key after the others, returns its index"""
+        idx = len(self.keys)
+        self.keys.append(key)
+        self.forms.append(self.transform(key))
+        self.positions[key] = idx
+        self.max_length = max(self.max_length, len(self.forms[idx]))
+        self.add(idx)
+        return idx
+
+    def remove(
+        self,
+        key: Text,
+    )-> None:
+        """Leave the key out of the results, its node still guides the search"""
+        self.removed.add(self.positions.pop(key))
+
+    def add(
+        self,
+        idx: int,
+    )-> None:
+        """Insert the key at `idx` into the tree"""
+        node = [idx, {}]
+        if self.root is None:
+            self.root = node
+            return
+
+        parent = self.root
+        form = self.forms[idx]
+        while True:
+            distance = ed.eval(form, self.forms[parent[0]])
+            child = parent[1].get(distance)
+            if child is None:
+                parent[1][distance] = node
+                return
+            parent = child
+
+    def nearest(
+        self,
+        word: Text,
+        threshold: float,
+    )-> Optional[Tuple[int, float]]:
+        """Find the nearest key within the threshold
+
+        Parameters
+        ----------
+        word : Text
+            Query word
+        threshold : float
+            Maximum normalized edit distance
+
+        Returns
+        -------
+        Optional[Tuple[int, float]]
+            Index of the best key and its normalized distance,
+            or None if no key is within the threshold.
+        """
+        nearest = self.nearest_k(word, 1, threshold)
+        return nearest[0] if nearest else None
+
+    def nearest_k(
+        self,
+        word: Text,
+        k: int,
+        threshold: float,
+    )-> List[Tuple[int, float]]:
+        """Find the k nearest keys within the threshold
+
+        Parameters
+        ----------
+        word : Text
+            Query word
+        k : int
+            Maximum number of keys
+        threshold : float
+            Maximum normalized edit distance
+
+        Returns
+        -------
+        List[Tuple[int, float]]
+            Index of the keys and their normalized distance, nearest first
+        """
+        top = TopK(k, threshold)
+        if self.root is None or k <= 0:
+            return []
+
+        word = self.transform(word)
+
+        # Any key within `bound` needs an edit distance of at most
+        # `bound * len(key)`, so the longest key gives the search radius.
+        radius = math.ceil(min(top.bound, 1.0) * self.max_length)
+        stack = [self.root]
+        while stack:
+            idx, children = stack.pop()
+            form = self.forms[idx]
+            d = ed.eval(word, form)
+            if idx not in self.removed and top.push(d / len(form), idx):
+                radius = math.ceil(min(top.bound, 1.0) * self.max_length)
+
+            # Triangle inequality: only subtrees in [d - radius, d + radius]
+            for edge, child in children.items():
+                if d - radius <= edge <= d + radius:
+                    stack.append(child)
+
+        return top.results()
+
+
+class LengthIndex:
+    def __init__(
+        self,
+        keys: List[Text],
+        transform: Callable[[Text], Text] = identity,
+        q: int = 1,
+    )-> None:
+        """Codebook keys grouped into buckets by their length
+
+        Since `ed.eval(word, key) >= abs(len(word) - len(key))`, a bucket of
+        length `L` can't hold a key closer than `abs(len(word) - L) / L`.
+        Buckets are visited from the query length outward and the search
+        stops as soon as that lower bound exceeds the current best.
+
+        Inside a bucket, a key within `e` edits shares at least
+        `max(len(word), L) + q - 1 - q * e` padded q-grams with the word,
+        so keys are counted through a per-bucket q-gram index before
+        `ed.eval`. With `q=1` these are just the shared characters.
+
+        Parameters
+        ----------
+        keys : List[Text]
+            Codebook keys in their original (codebook) order.
+        transform : Callable[[Text], Text]
+            Form of the keys and words that distances are computed on,
+            e.g. `decompose_jamo`. The forms of the keys are precomputed.
+        q : int
+            Size of the q-grams in the inverted index.
+        """
+        self.keys = list(keys)
+        self.transform = transform
+        self.forms = [transform(key) for key in self.keys]
+        self.q = q
+        self.positions = {key: idx for idx, key in enumerate(self.keys)}
+        self.removed: Set[int] = set()
+
+        # Bucket: {length: [index of the key, ...]} in codebook order
+        # Postings: {length: {q-gram: [(index of the key, count), ...]}}
+        self.buckets: Dict[int, List[int]] = {}
+        self.postings: Dict[int, Dict[Text, List[Tuple[int, int]]]] = {}
+        for idx in range(len(self.keys)):
+            self.add(idx)
+
+    def add(
+        self,
+        idx: int,
+    )-> None:
+        """Put the key at `idx` into its bucket and postings"""
+        form = self.forms[idx]
+        self.buckets.setdefault(len(form), []).append(idx)
+        postings = self.postings.setdefault(len(form), {})
+        for gram, count in self.grams(form).items():
+            postings.setdefault(gram, []).append((idx, count))
+
+    def insert(
+        self,
+        key: Text,
+    )-> int:
+        """Append a new key after the others, returns its index"""
+        idx = len(self.keys)
+        self.keys.append(key)
+        self.forms.append(self.transform(key))
+        self.positions[key] = idx
+        self.add(idx)
+        return idx
+
+    def remove(
+        self,
+        key: Text,
+    )-> None:
+        """Leave the key out of the results"""
+        self.removed.add(self.positions.pop(key))
+
+    def grams(
+        self,
+        form: Text,
+    )-> Counter:
+        """Count the q-grams of `form`, padded with q - 1 markers per side"""
+        if self.q == 1:
+            return Counter(form)
+
+        padded = "\x02" * (self.q - 1) + form + "\x03" * (self.q - 1)
+        return Counter(padded[i:i + self.q] for i in range(len(padded) - self.q + 1))
+
+    def nearest(
+        self,
+        word: Text,
+        threshold: float,
+    )-> Optional[Tuple[int, float]]:
+        """Find the nearest key within the threshold
+
+        Parameters
+        ----------
+        word : Text
+            Query word
+        threshold : float
+            Maximum normalized edit distance
+
+        Returns
+        -------
+        Optional[Tuple[int, float]]
+            Index of the best key and its normalized distance,
+            or None if no key is within the threshold.
+        """
+        nearest = self.nearest_k(word, 1, threshold)
+        return nearest[0] if nearest else None
+
+    def nearest_k(
+        self,
+        word: Text,
+        k: int,
+        threshold: float,
+    )-> List[Tuple[int, float]]:
+        """Find the k nearest keys within the threshold
+
+        Parameters
+        ----------
+        word : Text
+            Query word
+        k : int
+            Maximum number of keys
+        threshold : float
+            Maximum normalized edit distance
+
+        Returns
+        -------
+        List[Tuple[int, float]]
+            Index of the keys and their normalized distance, nearest first
+        """
+        top = TopK(k, threshold)
+        if k <= 0:
+            return []
+
+        # Lower bound of the normalized distance for each bucket
+        word = self.transform(word)
+        length = len(word)
+        grams = self.grams(word)
+        bounds = sorted(
+            (abs(length - size) / size, size) for size in self.buckets
+        )
+        for bound, size in bounds:
+            if bound > top.bound or bound >= 1.0:
+                break
+
+            # Q-grams shared with each key of the bucket
+            common: Dict[int, int] = {}
+            postings = self.postings[size]
+            for gram, count in grams.items():
+                for idx, key_count in postings.get(gram, ()):
+                    common[idx] = common.get(idx, 0) + min(count, key_count)
+
+            longest = max(length, size) + self.q - 1
+            required = longest - self.q * self._max_edits(top.bound, size)
+            if required > 0:
+                candidates = sorted(idx for idx, c in common.items() if c >= required)
+            else:
+                candidates = self.buckets[size]
+
+            for idx in candidates:
+                if common.get(idx, 0) < required or idx in self.removed:
+                    continue
+                distance = ed.eval(word, self.forms[idx]) / size
+                if top.push(distance, idx):
+                    required = longest - self.q * self._max_edits(top.bound, size)
+
+        return top.results()
+
+    @staticmethod
+    def _max_edits(
+        distance: float,
+        size: int,
+    )-> int:
+        """Edits allowed for a key of `size` within `distance` (rounded up)"""
+        return math.ceil(min(distance, 1.0) * size)
+
+
+# Q-gram size of the length index in jamo mode. Each edit destroys up to
+# q padded q-grams, so at the default threshold trigrams (q=3) shortlist
+# about ten times more keys than single jamo on the emotion codebook.
+JAMO_NGRAM = 1
+
+# Default threshold in jamo mode. A syllable edit costs one to three jamo
+# edits on keys about 2.4 times longer, so the syllable threshold of 0.4
+# rejects conjugated forms, e.g. 가엾은 for 가엾다 at 3/7 = 0.43. At 0.45,
+# jamo mode accepts 99% of the one-syllable variants of the codebook words
+# that syllable mode accepts, and single jamo still shortlist best.
+JAMO_THRESHOLD = 0.45
+
+
+INDEXES = {
+    "bktree": BKTree,
+    "length": LengthIndex,
+}
+
+
+def build_index(
+    keys: List[Text],
+    name: Text = "length",
+    jamo: bool = False,
+)-> "BKTree | LengthIndex":
+    """Build the search index named `name` over the codebook keys
+
+    Parameters
+    ----------
+    keys : List[Text]
+        Codebook keys in their original (codebook) order.
+    name : Text
+        Name of the index, one of `INDEXES`
+    jamo : bool
+        Compare jamo-decomposed forms instead of syllable blocks.
+        The length index then shortlists keys with jamo `JAMO_NGRAM`-grams.
+
+    Returns
+    -------
+    BKTree | LengthIndex
+        Search index
+    """
+    if name not in INDEXES:
+        raise ValueError(f"Unknown index '{name}', choose from {list(INDEXES)}")
+
+    if not jamo:
+        return INDEXES[name](keys)
+
+    if name == "length":
+        return LengthIndex(keys, transform=decompose_jamo, q=JAMO_NGRAM)
+    return INDEXES[name](keys, transform=decompose_jamo)
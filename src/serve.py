@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Copyright (c) 2024- SATURN
+# AUTHORS:
+# Sukbong Kwon (Galois)
+
+"""
+Production launcher with several server processes
+
+How to run
+python serve.py --workers 4 --port 8001
+
+The codebook and its index are loaded once here, then the server processes
+are forked and share them copy-on-write. `gc.freeze` keeps the collector of
+the workers from writing into those pages. Each worker runs its own uvicorn
+server on the socket bound by the parent and warms itself up in the
+lifespan of the app (see `backend.warmup`).
+
+Reloading: `POST /scoring/reload` on any worker, or `kill -HUP` on the
+launcher, reloads the codebook once in the launcher and replaces the
+workers one at a time, so they all serve the new codebook and share it
+again. The others keep serving meanwhile.
+
+Limits: every worker has its own counters, so `/metrics` describes the
+worker that answered the scrape, and the response cache is per worker.
+"""
+
+import gc
+import os
+import time
+import signal
+import socket
+import argparse
+from typing import Dict, List
+
+import uvicorn
+
+from app import app
+from backend.config import settings
+from backend.models import engine
+from backend.executor import executor, worker_engines
+
+
+def bind_socket(
+    host: str,
+    port: int,
+    backlog: int = 2048,
+)-> socket.socket:
+    """Socket shared by all the workers"""
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def preload(
+    reload: bool = False,
+)-> None:
+    """Load (or reload) the engine before forking so the workers share its memory"""
+    start = time.perf_counter()
+    if reload:
+        engine.reload()
+        # Collect the previous engine, then keep the new one out of the
+        # collector of the workers forked next
+        gc.unfreeze()
+        gc.collect()
+    scoring = engine.load()
+    if executor.mode == "process":
+        # Scoring processes forked by the workers find the engine ready
+        worker_engines.clear()
+        worker_engines[scoring.checksum] = scoring
+    gc.freeze()
+    print (f"==== {'Reloaded' if reload else 'Preloaded'} the codebook "
+           f"(version {scoring.version}) in {time.perf_counter() - start:.3f} sec ====")
+
+
+def run_worker(
+    sock: socket.socket,
+    log_level: str,
+)-> None:
+    """Serve the app in a forked worker, never returns"""
+    code = 0
+    try:
+        gc.enable()
+        for sig in (signal.SIGINT, signal.SIGTERM, signal.SIGHUP):
+            signal.signal(sig, signal.SIG_DFL)
+        engine.supervisor = os.getppid()
+        config = uvicorn.Config(app, log_level=log_level)
+        uvicorn.Server(config).run(sockets=[sock])
+    except BaseException as e:
+        print (f"==== Worker {os.getpid()} failed: {e} ====")
+        code = 1
+    finally:
+        os._exit(code)
+
+
+def spawn(
+    sock: socket.socket,
+    log_level: str,
+)-> int:
+    pid = os.fork()
+    if pid == 0:
+        run_worker(sock, log_level)
+    print (f"==== Started worker {pid} ====")
+    return pid
+
+
+def serve(
+    host: str,
+    port: int,
+    workers: int,
+    log_level: str = "info",
+)-> None:
+    """Fork `workers` servers, restart the ones that die until stopped
+
+    SIGHUP reloads the codebook and replaces the workers one by one.
+    """
+    # Objects created until the fork are never collected in the workers,
+    # so their pages are not written to and stay shared
+    gc.disable()
+    preload()
+    sock = bind_socket(host, port)
+
+    children: Dict[int, None] = {}
+    # Workers still serving the previous codebook and the one being replaced
+    retiring: List[int] = []
+    replacing = None
+    stopping = False
+
+    def retire_next():
+        nonlocal replacing
+        replacing = None
+        while retiring:
+            pid = retiring.pop(0)
+            if pid in children:
+                replacing = pid
+                os.kill(pid, signal.SIGTERM)
+                return
+        print ("==== All workers serve the reloaded codebook ====")
+
+    def stop(sig, frame):
+        nonlocal stopping
+        stopping = True
+        retiring.clear()
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def reload(sig, frame):
+        if stopping or replacing is not None:
+            print ("==== Reload already in progress ====")
+            return
+        try:
+            preload(reload=True)
+        except Exception as e:
+            print (f"==== Reload failed, keeping the workers: {e} ====")
+            return
+        retiring.extend(children)
+        retire_next()
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGHUP, reload)
+
+    print (f"==== Serving on http://{host}:{port} with {workers} workers ====")
+    for _ in range(workers):
+        children[spawn(sock, log_level)] = None
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        children.pop(pid, None)
+        if stopping:
+            continue
+        if pid == replacing:
+            # Its replacement serves the new codebook, then the next one
+            children[spawn(sock, log_level)] = None
+            retire_next()
+        else:
+            print (f"==== Worker {pid} exited ({status}), restarting ====")
+            time.sleep(1)
+            children[spawn(sock, log_level)] = None
+
+    sock.close()
+    print ("==== Stopped ====")
+
+
+def get_args(
+    argv: List[str] = None,
+)-> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Run the scoring app with several workers")
+    parser.add_argument("--host", type=str, default=settings.host)
+    parser.add_argument("--port", type=int, default=settings.port)
+    parser.add_argument("-w", "--workers", type=int, default=settings.workers)
+    parser.add_argument("--log-level", type=str, default="info")
+    return parser.parse_args(argv)
+
+
+def main():
+    args = get_args()
+    serve(args.host, args.port, max(args.workers, 1), args.log_level)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,4 +5,6 @@
 # Sukbong Kwon (Galois)
 
 
-from .decorators import decoding_decorator
\ No newline at end of file
+from .decorators import decoding_decorator, StageTimer
+from .cache import LRUCache
+from .statistics import ScoreStatistics
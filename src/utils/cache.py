@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Copyright (c) 2024- MAGO
+# AUTHORS:
+# Sukbong Kwon (Galois)
+
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+
+class LRUCache:
+    def __init__(
+        self,
+        maxsize: int = 4096,
+        ttl: Optional[float] = None,
+    )-> None:
+        """Size-bounded least-recently-used cache with hit/miss counters
+
+        Parameters
+        ----------
+        maxsize : int
+            Maximum number of entries, 0 disables the cache.
+        ttl : Optional[float]
+            Seconds an entry stays valid, None keeps entries until evicted.
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(
+        self,
+        key: Hashable,
+    )-> Optional[Any]:
+        """Get the value of `key` or None, marking it as recently used"""
+        with self._lock:
+            try:
+                value, expires = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            if expires is not None and expires <= time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(
+        self,
+        key: Hashable,
+        value: Any,
+    )-> None:
+        """Store `value` under `key`, evicting the least recently used entry"""
+        if self.maxsize <= 0:
+            return
+
+        expires = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(
+        self,
+    )-> None:
+        with self._lock:
+            self._data.clear()
+
+    def info(
+        self,
+    )-> Dict[str, int]:
+        """Counters of the cache for sizing it"""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+        }
@@ -5,12 +5,69 @@
 # Sukbong Kwon (Galois)
 
 import time
+from typing import Dict, Text
 
 # Define decorator to estimate the elapsed time
 def decoding_decorator(func):
     def wrapper(*args, **kwargs):
-        start = time.time()
+        start = time.perf_counter_ns()
         result = func(*args, **kwargs)
-        print(f"Elapsed time: {time.time() - start}")
+        print(f"Elapsed time: {(time.perf_counter_ns() - start) / 1e9}")
         return result
-    return wrapper
\ No newline at end of file
+    return wrapper
+
+
+class StageTimer:
+    __slots__ = ("start", "last", "stages")
+
+    def __init__(
+        self,
+    )-> None:
+        """Time spent in each stage of a request, in nanoseconds
+
+        `mark(stage)` charges the time since the previous mark to `stage`,
+        so the stages add up to the total. A stage marked several times
+        accumulates. Code paths that may be timed take `timer=None` and
+        only call `mark` when a timer is given, which keeps them free
+        when timing is off.
+        """
+        self.start = self.last = time.perf_counter_ns()
+        self.stages: Dict[Text, int] = {}
+
+    def mark(
+        self,
+        stage: Text,
+    )-> None:
+        now = time.perf_counter_ns()
+        self.stages[stage] = self.stages.get(stage, 0) + now - self.last
+        self.last = now
+
+    def update(
+        self,
+        other: "StageTimer",
+    )-> None:
+        """Take the stages of a copy of this timer used in another process"""
+        self.stages = other.stages
+        self.last = other.last
+
+    @property
+    def total(
+        self,
+    )-> int:
+        return self.last - self.start
+
+    def server_timing(
+        self,
+    )-> Text:
+        """Value of the `Server-Timing` header, durations in milliseconds"""
+        stages = [f"{stage};dur={ns / 1e6:.3f}" for stage, ns in self.stages.items()]
+        stages.append(f"total;dur={self.total / 1e6:.3f}")
+        return ", ".join(stages)
+
+    def profile(
+        self,
+    )-> Dict[Text, float]:
+        """Milliseconds of each stage and the total"""
+        profile = {stage: round(ns / 1e6, 3) for stage, ns in self.stages.items()}
+        profile["total"] = round(self.total / 1e6, 3)
+        return profile
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Copyright (c) 2024- MAGO
+# AUTHORS:
+# Sukbong Kwon (Galois)
+
+import math
+import numpy as np
+from typing import Callable, Dict, Sequence, Optional
+
+
+class ScoreStatistics:
+    def __init__(
+        self,
+        values: Callable[[], np.ndarray],
+        bins: int = 10,
+        percentiles: Sequence[float] = (5, 25, 50, 75, 95),
+    )-> None:
+        """Statistics of the codebook scores, cached and updated incrementally
+
+        Mean and standard deviation follow every change with Welford's
+        algorithm. Min/max are tracked unless the current extreme is removed.
+        Percentiles and the histogram need the whole score array, so they are
+        recomputed once, on the first `summary` after a change.
+
+        Parameters
+        ----------
+        values : Callable[[], np.ndarray]
+            Returns the current score array, used after changes
+        bins : int
+            Number of bins of the histogram
+        percentiles : Sequence[float]
+            Percentiles to report
+        """
+        self.values = values
+        self.bins = bins
+        self.percentiles = tuple(percentiles)
+        self.load(values())
+
+    def load(
+        self,
+        scores: np.ndarray,
+    )-> None:
+        """Compute every statistic from the score array"""
+        self.scores = scores
+        self.count = len(scores)
+        if self.count:
+            self.mean = float(np.mean(scores))
+            self.std = float(np.std(scores))
+            self.min = float(np.min(scores))
+            self.max = float(np.max(scores))
+        else:
+            self.mean = self.std = self.min = self.max = 0.0
+        self.m2 = self.std ** 2 * self.count
+
+        self._stale = False
+        self._extrema_stale = False
+        self._summary: Optional[Dict] = None
+
+    def add(
+        self,
+        score: float,
+    )-> None:
+        self.count += 1
+        delta = score - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (score - self.mean)
+        if self.count == 1:
+            self.min = self.max = score
+        elif not self._extrema_stale:
+            self.min = min(self.min, score)
+            self.max = max(self.max, score)
+        self._changed()
+
+    def remove(
+        self,
+        score: float,
+    )-> None:
+        if self.count <= 1:
+            self.count = 0
+            self.mean = self.m2 = 0.0
+            self.min = self.max = 0.0
+            self._changed()
+            return
+
+        self.count -= 1
+        delta = score - self.mean
+        self.mean -= delta / self.count
+        self.m2 = max(self.m2 - delta * (score - self.mean), 0.0)
+        if score <= self.min or score >= self.max:
+            self._extrema_stale = True
+        self._changed()
+
+    def update(
+        self,
+        old: float,
+        new: float,
+    )-> None:
+        self.remove(old)
+        self.add(new)
+
+    def _changed(
+        self,
+    )-> None:
+        self.std = math.sqrt(self.m2 / self.count) if self.count else 0.0
+        self._stale = True
+        self._summary = None
+
+    def summary(
+        self,
+    )-> Dict:
+        """Statistics of the scores (cached until the next change)
+
+        Returns
+        -------
+        Dict
+            count, mean, std, min, max, percentiles and histogram
+        """
+        if self._summary is not None:
+            return self._summary
+
+        if self._stale:
+            self.scores = self.values()
+            self._stale = False
+        if self._extrema_stale:
+            self.min = float(np.min(self.scores)) if self.count else 0.0
+            self.max = float(np.max(self.scores)) if self.count else 0.0
+            self._extrema_stale = False
+
+        if self.count:
+            percentiles = np.percentile(self.scores, self.percentiles).tolist()
+            counts, edges = np.histogram(self.scores, bins=self.bins)
+        else:
+            percentiles = [0.0] * len(self.percentiles)
+            counts, edges = np.zeros(self.bins, dtype=int), np.zeros(self.bins + 1)
+
+        self._summary = {
+            "count": self.count,
+            "mean": self.mean,
+            "std": self.std,
+            "min": self.min,
+            "max": self.max,
+            "percentiles": {
+                f"p{p:g}": value for p, value in zip(self.percentiles, percentiles)
+            },
+            "histogram": {
+                "counts": counts.tolist(),
+                "edges": edges.tolist(),
+            },
+        }
+        return self._summary